@@ -1,15 +1,41 @@
-from agno.agent import Agent
-from agno.models.openai import OpenAIChat
 from core.models import ExtractedEntities, GraphSchemaMapping
-from typing import List
+from typing import TYPE_CHECKING, AsyncIterator, List
+import functools
+import httpx
 import json
+import orjson
 
-def entities_extraction_agent():
-    return Agent(
-        name="PDF Entity Extraction Agent",
-        model=OpenAIChat(id="gpt-4o"),
-        description="Extract meaningful entities and rich, context-specific relationships from the text chunk.",
-        instructions = """
+# agno pulls in a large dependency tree; it is imported where an agent is first built, not at startup
+if TYPE_CHECKING:
+    from agno.agent import Agent
+    from agno.models.openai import OpenAIChat
+
+# One keep-alive (HTTP/2) connection pool for every OpenAI call in the process
+http_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=60
+)
+
+def chat_model(model_id: str) -> "OpenAIChat":
+    from agno.models.openai import OpenAIChat
+    return OpenAIChat(id=model_id, http_client=http_client)
+
+# Extraction runs on the small model; chunks it fails on are retried on the escalation model
+EXTRACTION_MODEL = "gpt-4o-mini"
+ESCALATION_MODEL = "gpt-4o"
+
+# Strict structured outputs: the model can only emit JSON matching ExtractedEntities, so no retry/repair loop
+EXTRACTION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "ExtractedEntities",
+        "strict": True,
+        "schema": ExtractedEntities.model_json_schema()
+    }
+}
+
+EXTRACTION_INSTRUCTIONS = """
         You are an expert information extraction assistant specializing in building high-quality knowledge graphs.
         Your goal is to extract entities and RICH, CONTEXT-SPECIFIC relationships that capture the actual meaning from the text.
 
@@ -29,8 +55,6 @@ def entities_extraction_agent():
         ✓ Include technical terms that are defined/explained in context
         ✓ Extract domain-specific concepts that carry meaning
         
-        ✗ NO standalone dates/numbers ("2008", "10 minutes", "1MB")
-        ✗ NO single variables ("x", "y", "p", "q")
         ✗ NO generic terms ("the method", "the approach", "the system")
         ✗ NO unexplained acronyms from citations
         
@@ -69,21 +93,64 @@ def entities_extraction_agent():
             ]
         }
 
-        Analyze ONLY this chunk and extract the knowledge graph:
-        """,
-        output_schema=ExtractedEntities
-    )
+        CONTEXT INSTRUCTIONS:
+        - You are given the current chunk plus surrounding context (previous/next chunks)
+        - Extract entities and relationships ONLY from the [CURRENT CHUNK TO ANALYZE]
+        - Use the context sections to better understand references, pronouns, and implicit connections
+        - If the current chunk refers to something mentioned in context, use the full proper name
+        
+        Example:
+        [PREVIOUS CONTEXT]: "Bitcoin uses Proof-of-Work consensus..."
+        [CURRENT CHUNK]: "This mechanism prevents double-spending by requiring computational work."
+        [NEXT CONTEXT]: "The network validates each transaction..."
+        
+        You should extract:
+        - "Proof-of-Work" (mentioned in previous, referenced as "This mechanism")
+        - "Double-Spending" 
+        - Relationship: "Proof-of-Work" → "prevents" → "Double-Spending"
 
-def graphrag_agent(question: str, context_chunks: list, entities: list, relationships: list):
-    chunks_text = "\n\n".join([f"[Chunk {i+1}]: {c}" for i, c in enumerate(context_chunks)])
-    entities_text = "\n".join([f"- {e['name']} ({e['type']})" for e in entities])
-    relationships_text = "\n".join([f"- {r['from']} --[{r['type']}]--> {r['to']}" for r in relationships])
-    
-    agent = Agent(
-        model=OpenAIChat(id="gpt-4o"),
-        instructions=f"""
+        Analyze ONLY the current chunk and extract the knowledge graph.
+        """
+
+GRAPHRAG_INSTRUCTIONS = """
         You are a GraphRAG assistant. Use the provided context to answer the question.
+        The user message contains the retrieved context (text chunks and knowledge graph) followed by the question.
+
+        Rules:
+        1. Use the text chunks AND the graph structure to answer.
+        2. DO NOT repeat or quote the chunk text.
+        3. DO NOT print the context or chunk labels in your answer.
+        4. If useful, you may reference chunks like (Chunk 1), but do NOT paste their content.
+        5. If the answer is not in the context, say "I don't have enough information to answer that."
+        6. Do NOT make up information.
+
+        Only return the final answer. No meta commentary.
+        """
+
+# Built once, on first use, and reused for every question: only the user message changes per request
+@functools.lru_cache(maxsize=1)
+def _graphrag_agent() -> "Agent":
+    from agno.agent import Agent
+    return Agent(
+        model=chat_model("gpt-4o"),
+        instructions=GRAPHRAG_INSTRUCTIONS,
+        markdown=True
+    )
+
+def _format_node(node: dict) -> str:
+    data = node['data']
+    name = data.get('title') or data.get('name') or data.get('id')
+    # JSON rather than the dict repr: valid for the model and fewer tokens than Python syntax
+    return f"- [{node['label']}] {name}: {orjson.dumps(data, default=str).decode()}"
 
+@functools.lru_cache(maxsize=128)
+def render_context(chunks: tuple, entities: tuple, relationships: tuple) -> str:
+    """Render retrieved context once per distinct (chunks, entities, relationships) set"""
+    chunks_text = "\n\n".join(f"[Chunk {i+1}]: {c}" for i, c in enumerate(chunks))
+    entities_text = "\n".join(f"- {name} ({type_})" for name, type_ in entities)
+    relationships_text = "\n".join(f"- {from_} --[{type_}]--> {to}" for from_, type_, to in relationships)
+
+    return f"""
         CONTEXT FROM VECTOR SEARCH (Text Chunks):
         {chunks_text}
 
@@ -94,32 +161,50 @@ def graphrag_agent(question: str, context_chunks: list, entities: list, relation
 
         Relationships:
         {relationships_text}
+        """
 
-        Rules:
-        1. Use the text chunks AND the graph structure to answer.
-        2. DO NOT repeat or quote the chunk text.
-        3. DO NOT print the context or chunk labels in your answer.
-        4. If useful, you may reference chunks like (Chunk 1), but do NOT paste their content.
-        5. If the answer is not in the context, say "I don't have enough information to answer that."
-        6. Do NOT make up information.
-
-        Only return the final answer. No meta commentary.
-        Question: {question}
-        """,
-        markdown=True
+def _graphrag_prompt(question: str, context_chunks: list, entities: list, relationships: list) -> str:
+    # Context goes first so follow-up questions over the same context share a prompt prefix,
+    # which OpenAI's automatic prompt caching bills at a discount
+    context = render_context(
+        tuple(context_chunks),
+        tuple((e['name'], e['type']) for e in entities),
+        tuple((r['from'], r['type'], r['to']) for r in relationships)
     )
+    return f"""{context}
+        Question: {question}
+        """
+
+def graphrag_agent(question: str, context_chunks: list, entities: list, relationships: list):
+    prompt = _graphrag_prompt(question, context_chunks, entities, relationships)
     
     try:
-        response = agent.run(question)
+        response = _graphrag_agent().run(prompt)
         return response.content
     except Exception as e:
         print(f"❌ GraphRAG Agent Error: {e}")
         return f"Error generating answer: {str(e)}"
 
-def sql_schema_agent():
+async def graphrag_agent_stream(question: str, context_chunks: list, entities: list, relationships: list) -> AsyncIterator[str]:
+    """Same as graphrag_agent, but yields the answer token by token as the model produces it"""
+    prompt = _graphrag_prompt(question, context_chunks, entities, relationships)
+
+    from agno.run.agent import RunContentEvent
+
+    try:
+        async for event in _graphrag_agent().arun(prompt, stream=True):
+            if isinstance(event, RunContentEvent) and event.content:
+                yield event.content
+    except Exception as e:
+        print(f"❌ GraphRAG Agent Error: {e}")
+        yield f"Error generating answer: {str(e)}"
+
+@functools.lru_cache(maxsize=None)
+def sql_schema_agent() -> "Agent":
+    from agno.agent import Agent
     return Agent(
         name="SQL Schema to Graph Mapper",
-        model=OpenAIChat(id="gpt-4o"),
+        model=chat_model("gpt-4o"),
         description="Map SQL tables to Knowledge Graph Nodes and Relationships.",
         instructions="""
         You are an expert Data Architect. Your goal is to convert a Relational Schema (SQL) into a Semantic Knowledge Graph.
@@ -144,21 +229,32 @@ def sql_schema_agent():
         output_schema=GraphSchemaMapping
     )
 
-def sql_graphrag_agent(question: str, context: dict):
-    nodes_text = ""
-    for node in context['nodes']:
-        label = node['label']
-        data = node['data']
-        name = data.get('title') or data.get('name') or data.get('id')
-        nodes_text += f"- [{label}] {name}: {data}\n"
+SQL_GRAPHRAG_INSTRUCTIONS = """
+        You are a SQL Data Assistant powered by a Knowledge Graph.
+        The user message contains the database context (entities found via vector search and
+        relationships found via graph traversal) followed by the question.
+        
+        INSTRUCTIONS:
+        1. Answer the user's question based ONLY on the provided database context.
+        2. If you cite a movie or person, mention specific details (e.g., "The Godfather (1972)").
+        3. Use the relationship data to explain connections (e.g., "Directed by...").
+        4. If the answer is not in the data, say "I cannot find that information in the database."
+        """
+
+@functools.lru_cache(maxsize=1)
+def _sql_graphrag_agent() -> "Agent":
+    from agno.agent import Agent
+    return Agent(
+        model=chat_model("gpt-4o"),
+        instructions=SQL_GRAPHRAG_INSTRUCTIONS,
+        markdown=True
+    )
 
+def sql_graphrag_agent(question: str, context: dict):
+    nodes_text = "\n".join(map(_format_node, context['nodes']))
     relationships_text = "\n".join(context['relationships'])
 
-    agent = Agent(
-        model=OpenAIChat(id="gpt-4o"),
-        instructions=f"""
-        You are a SQL Data Assistant powered by a Knowledge Graph.
-        
+    prompt = f"""
         CONTEXT FROM DATABASE:
         
         Found Entities (via Vector Search):
@@ -167,34 +263,17 @@ def sql_graphrag_agent(question: str, context: dict):
         Connected Relationships (via Graph Traversal):
         {relationships_text}
         
-        INSTRUCTIONS:
-        1. Answer the user's question based ONLY on the provided database context.
-        2. If you cite a movie or person, mention specific details (e.g., "The Godfather (1972)").
-        3. Use the relationship data to explain connections (e.g., "Directed by...").
-        4. If the answer is not in the data, say "I cannot find that information in the database."
-        
         Question: {question}
-        """,
-        markdown=True
-    )
+        """
     
     try:
-        response = agent.run(question)
+        response = _sql_graphrag_agent().run(prompt)
         return response.content
     except Exception as e:
         return f"Error generating answer: {str(e)}"
 
-def label_router_agent(question: str, available_labels: List[str]) -> List[str]:
-    """Decides which Graph Labels to search based on the user's question"""
-    agent = Agent(
-        model=OpenAIChat(id="gpt-4o"),
-        description="You are a Query Router. Your job is to select the most relevant database tables (Labels) for a given question.",
-        instructions=f"""
-        You are given a list of Knowledge Graph Labels (which represent SQL Tables).
-        
-        AVAILABLE LABELS: {json.dumps(available_labels)}
-        
-        USER QUESTION: "{question}"
+LABEL_ROUTER_INSTRUCTIONS = """
+        You are given a list of Knowledge Graph Labels (which represent SQL Tables) and a user question.
         
         TASK:
         1. Identify which Labels are most likely to contain the answer.
@@ -206,12 +285,28 @@ def label_router_agent(question: str, available_labels: List[str]) -> List[str]:
         Labels: ["Movie", "Actor", "Director", "Studio"]
         Question: "Who directed The Godfather?"
         Output: ["Movie", "Director"]
-        """,
-        markdown=False 
+        """
+
+@functools.lru_cache(maxsize=1)
+def _label_router_agent() -> "Agent":
+    from agno.agent import Agent
+    return Agent(
+        model=chat_model("gpt-4o"),
+        description="You are a Query Router. Your job is to select the most relevant database tables (Labels) for a given question.",
+        instructions=LABEL_ROUTER_INSTRUCTIONS,
+        markdown=False
     )
+
+def label_router_agent(question: str, available_labels: List[str]) -> List[str]:
+    """Decides which Graph Labels to search based on the user's question"""
+    prompt = f"""
+        AVAILABLE LABELS: {json.dumps(available_labels)}
+        
+        USER QUESTION: "{question}"
+        """
     
     try:
-        response = agent.run(f"Select labels for: {question}")
+        response = _label_router_agent().run(prompt)
         content = response.content.strip()
         start = content.find('[')
         end = content.rfind(']') + 1
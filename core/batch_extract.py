@@ -0,0 +1,96 @@
+import json
+import os
+import time
+from typing import Dict, Any, List
+from core.agents import EXTRACTION_INSTRUCTIONS, EXTRACTION_MODEL, EXTRACTION_RESPONSE_FORMAT
+from core.models import ExtractedEntities
+from core.pdf_processor import client, build_extraction_prompt, filter_extraction
+
+USE_BATCH_API = os.getenv("USE_BATCH_API", "false").lower() == "true"
+BATCH_MIN_CHUNKS = int(os.getenv("BATCH_MIN_CHUNKS", "20"))
+BATCH_POLL_INTERVAL = int(os.getenv("BATCH_POLL_INTERVAL", "30"))
+
+def should_use_batch_api(chunks: List[str]) -> bool:
+    """Large documents go through the Batch API when it is enabled, small ones stay interactive"""
+    return USE_BATCH_API and len(chunks) > BATCH_MIN_CHUNKS
+
+def _batch_request(custom_id: str, prompt: str) -> Dict[str, Any]:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": EXTRACTION_MODEL,
+            "messages": [
+                {"role": "system", "content": EXTRACTION_INSTRUCTIONS},
+                {"role": "user", "content": prompt}
+            ],
+            "response_format": EXTRACTION_RESPONSE_FORMAT
+        }
+    }
+
+def _wait_for_batch(batch_id: str):
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_INTERVAL)
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            print(f"  Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total})")
+    return batch
+
+def extract_entities_batch_api(chunks: List[str]) -> List[Dict[str, Any]]:
+    """Extract entities from all chunks through the OpenAI Batch API"""
+    lines = []
+    for i, chunk in enumerate(chunks):
+        previous_chunk = chunks[i-1] if i > 0 else None
+        next_chunk = chunks[i+1] if i < len(chunks) - 1 else None
+        prompt = build_extraction_prompt(chunk, previous_chunk, next_chunk)
+        lines.append(json.dumps(_batch_request(f"chunk-{i}", prompt)))
+
+    batch_file = client.files.create(
+        file=("extraction.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"✓ Submitted extraction batch {batch.id} ({len(chunks)} chunks)")
+
+    batch = _wait_for_batch(batch.id)
+    if batch.status != "completed":
+        raise RuntimeError(f"Extraction batch {batch.id} ended with status '{batch.status}'")
+
+    results = {}
+    if batch.output_file_id:
+        output = client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"⚠️ Batch request {record['custom_id']} failed: {record.get('error')}")
+                continue
+
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[record["custom_id"]] = filter_extraction(ExtractedEntities.model_validate_json(content))
+            except Exception as e:
+                print(f"⚠️ Could not parse batch result {record['custom_id']}: {e}")
+
+    chunk_extractions = []
+    for i, chunk in enumerate(chunks):
+        data = results.get(f"chunk-{i}", {"entities": [], "relationships": []})
+        chunk_extractions.append({
+            'chunk_index': i,
+            'chunk_text': chunk,
+            'entities': data['entities'],
+            'relationships': data['relationships']
+        })
+
+    print(f"✓ Batch extraction finished: {len(results)}/{len(chunks)} chunks parsed")
+    return chunk_extractions
@@ -0,0 +1,82 @@
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Any, List, Set
+from core.models import Entity, Relationship
+
+SIMILARITY_THRESHOLD = 0.85
+SHINGLE_SIZE = 3
+
+def normalize_name(name: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", name).lower().split())
+
+def _shingles(text: str) -> Set[str]:
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def canonical_entity_names(chunk_extractions: List[Dict]) -> Dict[str, str]:
+    """Map every extracted entity name to the first-seen name of its near-duplicate group"""
+    canonical = {}
+    groups = []
+    shingle_index = defaultdict(set)
+
+    for extraction in chunk_extractions:
+        for entity in extraction['entities']:
+            if entity.name in canonical:
+                continue
+
+            shingles = _shingles(normalize_name(entity.name))
+
+            # Only groups sharing at least one shingle can reach the threshold
+            candidates = set()
+            for shingle in shingles:
+                candidates |= shingle_index[shingle]
+
+            match = None
+            for group_id in sorted(candidates):
+                group_name, group_shingles = groups[group_id]
+                if len(shingles & group_shingles) / len(shingles | group_shingles) >= SIMILARITY_THRESHOLD:
+                    match = group_name
+                    break
+
+            if match is None:
+                groups.append((entity.name, shingles))
+                for shingle in shingles:
+                    shingle_index[shingle].add(len(groups) - 1)
+                match = entity.name
+
+            canonical[entity.name] = match
+
+    return canonical
+
+def dedupe_extractions(chunk_extractions: List[Dict]) -> List[Dict[str, Any]]:
+    """Rewrite entities and relationships to canonical names, dropping duplicates within each chunk"""
+    canonical = canonical_entity_names(chunk_extractions)
+
+    deduped = []
+    for extraction in chunk_extractions:
+        entities = {}
+        for entity in extraction['entities']:
+            name = canonical[entity.name]
+            if name not in entities:
+                entities[name] = Entity(name=name, type=entity.type)
+
+        # Relationship is frozen (hashable), so an insertion-ordered dict doubles as an ordered set
+        relationships = {}
+        for rel in extraction['relationships']:
+            from_entity = canonical.get(rel.from_entity, rel.from_entity)
+            to_entity = canonical.get(rel.to_entity, rel.to_entity)
+            # Two spellings of the same entity collapse into a self-loop; it carries no information
+            if from_entity == to_entity:
+                continue
+            relationships[Relationship(from_entity=from_entity, to_entity=to_entity, type=rel.type)] = None
+
+        deduped.append({
+            **extraction,
+            'entities': list(entities.values()),
+            'relationships': list(relationships)
+        })
+
+    merged = len(canonical) - len(set(canonical.values()))
+    print(f"✓ Deduplication merged {merged} near-duplicate entity names")
+    return deduped
@@ -1,6 +1,20 @@
+import asyncio
 import uuid
+from typing import Any, List, Tuple
 from services.neo4j_service import Neo4jService
-from core.pdf_processor import extract_text_from_pdf, chunk_text, embed_text, extract_entities_per_chunk, merge_entity_relationships
+from core.pdf_processor import extract_text_from_pdf, chunk_text, embed_text, extract_batch, merge_entity_relationships
+from core.batch_extract import should_use_batch_api, extract_entities_batch_api
+from core.dedupe import dedupe_extractions
+
+async def _embed_and_extract(chunks: List[str]) -> Tuple[Any, Any]:
+    """Embed the chunks and extract their entities concurrently; failures are returned, not raised"""
+    embedding = asyncio.to_thread(embed_text, chunks)
+    if should_use_batch_api(chunks):
+        extraction = asyncio.to_thread(extract_entities_batch_api, chunks)
+    else:
+        extraction = extract_batch(chunks)
+
+    return tuple(await asyncio.gather(embedding, extraction, return_exceptions=True))
 
 def load_pipeline(pdf_path: str, filename: str, neo4j_service: Neo4jService):
     print(f"Processing PDF: {filename}")
@@ -25,71 +39,72 @@ def load_pipeline(pdf_path: str, filename: str, neo4j_service: Neo4jService):
     chunks = chunk_text(text)
     print(f"✓ Created {len(chunks)} chunks")
     
-    # Step 3: Generate embeddings for chunks
+    # Steps 3 + 4: embeddings and entity extraction only share the chunk list, so run them side by side
     print("STEP 3: Generating embeddings for chunks...")
-    try:
-        chunk_embeddings = embed_text(chunks)
-        print(f"✓ Generated {len(chunk_embeddings)} embeddings")
-    except Exception as e:
-        print(f"❌ Failed to generate embeddings: {e}")
+    print("STEP 4: Extracting entities and relationships from each chunk...")
+    chunk_embeddings, chunk_extractions = asyncio.run(_embed_and_extract(chunks))
+
+    if isinstance(chunk_embeddings, Exception):
+        print(f"❌ Failed to generate embeddings: {chunk_embeddings}")
         return {
             "success": False,
-            "error": f"Embedding generation failed: {str(e)}",
+            "error": f"Embedding generation failed: {str(chunk_embeddings)}",
             "doc_id": doc_id
         }
+    print(f"✓ Generated {len(chunk_embeddings)} embeddings")
+
+    if isinstance(chunk_extractions, Exception):
+        raise chunk_extractions
+
+    # Collapse near-duplicate entity names so each becomes a single graph node
+    chunk_extractions = dedupe_extractions(chunk_extractions)
     
-    # Step 4: Extract entities PER CHUNK
-    print("STEP 4: Extracting entities and relationships from each chunk...")
-    chunk_extractions = extract_entities_per_chunk(chunks)
-    
-    # Merge entities across chunks
-    merged_data = merge_entity_relationships(chunk_extractions)
+    # Merge entities across chunks, building the entity write rows in the same pass
+    chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+    merged_data = merge_entity_relationships(chunk_extractions, chunk_ids)
     entities = merged_data['entities']
     relationships = merged_data['relationships']
+    entity_rows = merged_data['entity_rows']
     
     # Step 5: Store in Neo4j
     print("STEP 5: Storing in Neo4j knowledge graph...")
     
     try:
-        # Create document node
-        neo4j_service.create_document_node(doc_id, filename, text)
-        print(f"✓ Created document node: {filename}")
 
-        # Create chunk nodes with embeddings and store chunk IDs
-        chunk_ids = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, chunk_embeddings)):
-            chunk_id = str(uuid.uuid4())
-            chunk_ids.append(chunk_id)
-            neo4j_service.create_chunk_node(chunk_id, chunk, i, embedding, doc_id)
+        # Document, chunks and NEXT links commit together in one transaction
+        with neo4j_service.transaction() as tx:
+            # Create document node
+            neo4j_service.create_document_node(doc_id, filename, tx=tx)
+
+            # Create chunk nodes with embeddings and sequential relationships between them
+            # One tolist() over the whole float32 matrix, not one per chunk
+            neo4j_service.create_chunk_nodes_bulk([
+                {"id": chunk_id, "text": chunk, "index": i, "embedding": embedding}
+                for i, (chunk_id, chunk, embedding) in enumerate(zip(chunk_ids, chunks, chunk_embeddings.tolist()))
+            ], doc_id, tx=tx)
+            neo4j_service.create_chunk_relationships(chunk_ids, tx=tx)
+        print(f"✓ Created document node: {filename}")
         print(f"✓ Created {len(chunk_ids)} chunk nodes with embeddings")
         
-        # Create sequential relationships between chunks
-        neo4j_service.create_chunk_relationships(chunk_ids)
-        
-        # Create entity nodes linked to their source chunks
-        entity_count = 0
-        for extraction in chunk_extractions:
-            chunk_idx = extraction['chunk_index']
-            chunk_id = chunk_ids[chunk_idx]
-            
-            for entity in extraction['entities']:
-                neo4j_service.create_entity(entity.name, entity.type, chunk_id)
-                entity_count += 1
-                
-                if entity_count % 20 == 0:
-                    print(f"  ✓ Created {entity_count} entities...")
-        
-        print(f"✓ Created {entity_count} entity nodes (linked to chunks)")
+        # Create entity nodes linked to their source chunks; Neo4j dedupes them on the unique name key.
+        # Entities and relationships are written by parallel workers, partitioned by entity name; shared
+        # chunks and target entities can still deadlock workers, and those transactions are retried
+        neo4j_service.write_partitioned(
+            neo4j_service.create_entities_bulk, entity_rows,
+            key=lambda row: row["name"].strip().lower()
+        )
+        print(f"✓ Created {len(entity_rows)} entity links (linked to chunks)")
         
         # Create relationships between entities
-        for i, rel in enumerate(relationships):
-            neo4j_service.create_relationship(rel.from_entity, rel.to_entity, rel.type)
-            if (i + 1) % 20 == 0:
-                print(f"  ✓ Created {i + 1}/{len(relationships)} relationships...")
+        neo4j_service.write_partitioned(
+            neo4j_service.create_relationships_bulk,
+            [{"from": rel.from_entity, "to": rel.to_entity, "type": rel.type} for rel in relationships],
+            key=lambda row: row["from"].strip().lower()
+        )
         print(f"✓ Created {len(relationships)} relationships")
-        
-        # Create indexes
-        neo4j_service.create_indexes()
+
+        # Cached retrievals predate this document
+        neo4j_service.invalidate_retrieval_cache()
         
         print(f"✅ SUCCESS! Processed '{filename}'")
         print("📊 Statistics:")
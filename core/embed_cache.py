@@ -0,0 +1,48 @@
+import hashlib
+import os
+import sqlite3
+import numpy as np
+from typing import Dict, Iterable, List, Tuple
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+
+# SQLite caps bound parameters per statement
+_LOOKUP_BATCH = 900
+
+def embedding_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(model.encode("utf-8") + b"\0" + text.encode("utf-8")).digest()
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(EMBED_CACHE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(EMBED_CACHE_PATH, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+    return conn
+
+def get_many(keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+    """Cached vectors for whichever keys are present"""
+    found = {}
+    conn = _connect()
+    try:
+        for start in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[start:start + _LOOKUP_BATCH]
+            rows = conn.execute(
+                f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for key, vec in rows:
+                found[key] = np.frombuffer(vec, dtype=np.float32)
+    finally:
+        conn.close()
+    return found
+
+def put_many(items: Iterable[Tuple[bytes, np.ndarray]]):
+    # float32 blobs: ~6 KB per 1536-dim vector instead of ~30 KB of JSON text
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (hash, vec) VALUES (?, ?)",
+                ((key, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items)
+            )
+    finally:
+        conn.close()
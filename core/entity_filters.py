@@ -0,0 +1,28 @@
+import re
+
+_UNITS = (
+    r"%|ms|s|secs?|seconds?|mins?|minutes?|hrs?|hours?|days?|weeks?|months?|years?"
+    r"|[kmgt]?b|bytes?|[kmgt]?bits?|nodes?|blocks?|transactions?|btc"
+)
+
+# Names that are never useful graph nodes: bare numbers/dates, measurements and single-letter variables
+JUNK_ENTITY_PATTERN = re.compile(
+    rf"""^(?:
+        \d[\d.,:/\-\s]*
+        | \d+(?:\.\d+)?\s*(?:{_UNITS})
+        | [a-z]
+    )$""",
+    re.IGNORECASE | re.VERBOSE
+)
+
+GENERIC_TERMS = frozenset({
+    'the', 'this', 'that', 'these', 'those', 'it', 'its',
+    'system', 'method', 'approach', 'technique', 'process'
+})
+
+GENERIC_REL_TYPES = frozenset({
+    'related', 'connected', 'associated', 'linked', 'has', 'uses', 'involves'
+})
+
+def is_junk_entity(name: str) -> bool:
+    return len(name) < 3 or name.lower() in GENERIC_TERMS or JUNK_ENTITY_PATTERN.match(name.strip()) is not None
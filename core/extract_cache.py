@@ -0,0 +1,61 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+from core.agents import EXTRACTION_INSTRUCTIONS, EXTRACTION_MODEL, ESCALATION_MODEL
+from core.models import ExtractedEntities
+
+EXTRACT_CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", ".cache/extract")
+EXTRACT_CACHE_SIZE = int(os.getenv("EXTRACT_CACHE_SIZE", "2048"))
+
+# Changing the prompt or the models changes every key, so stale extractions are never served
+AGENT_VERSION = hashlib.sha256(
+    "\0".join([EXTRACTION_MODEL, ESCALATION_MODEL, EXTRACTION_INSTRUCTIONS]).encode("utf-8")
+).hexdigest()[:16]
+
+_extraction_cache = OrderedDict()
+
+def extraction_key(chunk: str, previous_chunk: str = None, next_chunk: str = None) -> str:
+    """Hash of everything the model sees for a chunk: the agent version, the chunk and its context window"""
+    parts = [AGENT_VERSION, (previous_chunk or "")[-500:], chunk, (next_chunk or "")[:500]]
+    return hashlib.sha256(b"\0".join(part.encode("utf-8") for part in parts)).hexdigest()
+
+def _remember(key: str, extraction: ExtractedEntities):
+    _extraction_cache[key] = extraction
+    _extraction_cache.move_to_end(key)
+    if len(_extraction_cache) > EXTRACT_CACHE_SIZE:
+        _extraction_cache.popitem(last=False)
+
+def get_cached_extraction(key: str) -> Optional[ExtractedEntities]:
+    """Look the key up in memory first, then on disk"""
+    if key in _extraction_cache:
+        _extraction_cache.move_to_end(key)
+        return _extraction_cache[key]
+
+    cache_path = os.path.join(EXTRACT_CACHE_DIR, f"{key}.json")
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            extraction = ExtractedEntities.model_validate(json.load(f)["extraction"])
+    except Exception as e:
+        # Unreadable or from an older schema: treat as a miss and let the next write replace it
+        print(f"⚠️ Ignoring unreadable extraction cache entry {cache_path}: {e}")
+        return None
+
+    _remember(key, extraction)
+    return extraction
+
+def cache_extraction(key: str, extraction: ExtractedEntities):
+    _remember(key, extraction)
+
+    os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+    with open(os.path.join(EXTRACT_CACHE_DIR, f"{key}.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "agent_version": AGENT_VERSION,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "extraction": extraction.model_dump()
+        }, f)
@@ -1,28 +1,41 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Dict, Any, List, Optional
 
 class Entity(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     name: str
     type: str
 
 class Relationship(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     from_entity: str
     to_entity: str
     type: str
 
 class ExtractedEntities(BaseModel):
+    # extra="forbid" emits additionalProperties: false, which OpenAI strict structured outputs require
+    model_config = ConfigDict(extra="forbid")
+
     entities: List[Entity]
     relationships: List[Relationship]
 
 class RAGChunk(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     text: str
     score: Optional[float] = None
 
 class RAGEntity(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     name: str
     type: Optional[str] = None
 
 class RAGRelationship(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     type: str
     source: Optional[str] = None
     target: Optional[str] = None
@@ -53,6 +66,8 @@ class UploadResponse(BaseModel):
     error: Optional[str] = None
 
 class SQLColumnMapping(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     column_name: str
     target_property: str
     is_embedding_candidate: bool = False
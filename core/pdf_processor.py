@@ -1,37 +1,89 @@
-from typing import Dict, Any, List
-from pypdf import PdfReader
-from agno.knowledge.chunking.agentic import AgenticChunking
-from agno.knowledge.document.base import Document
-from agno.models.openai import OpenAIChat
-from agno.agent import Agent
-from core.agents import entities_extraction_agent
-from openai import OpenAI
+from typing import Any, Awaitable, Callable, Dict, Iterator, List
+from core.agents import EXTRACTION_INSTRUCTIONS, EXTRACTION_MODEL, ESCALATION_MODEL, EXTRACTION_RESPONSE_FORMAT, chat_model, http_client
+from core.models import ExtractedEntities
+from core.entity_filters import GENERIC_REL_TYPES, is_junk_entity
+from core.extract_cache import extraction_key, get_cached_extraction, cache_extraction
+from core.embed_cache import embedding_key, get_many, put_many
+from openai import AsyncOpenAI, OpenAI, RateLimitError
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import asyncio
+import numpy as np
 import os
+import time
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+
+MAX_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "32"))
+MAX_RATE_LIMIT_RETRIES = 5
+MIN_ENTITIES = int(os.getenv("EXTRACT_MIN_ENTITIES", "1"))
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+EMBED_BATCH_SIZE = 256
+# The endpoint caps total tokens per request; len(text) // 4 is a cheap estimate
+EMBED_BATCH_TOKENS = 250_000
+EMBED_RETRIES = 3
+EMBED_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+
+def _pdf_workers(n_pages: int) -> int:
+    workers = int(os.getenv("PDF_WORKERS", "0")) or os.cpu_count() or 1
+    return max(1, min(workers, n_pages))
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Worker: PdfReader objects don't pickle, so each process opens the file itself"""
+    from pypdf import PdfReader
+
+    pdf_reader = PdfReader(file_path)
+    texts = []
+    for page_index in range(start, stop):
+        try:
+            page_text = pdf_reader.pages[page_index].extract_text()
+            texts.append(page_text.strip() if page_text else "")
+        except Exception as e:
+            print(f"⚠️ Warning: Cannot extract page {page_index + 1}: {e}")
+            texts.append("")
+    return texts
+
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """Yield page texts in page order as the workers finish each page range"""
+    from pypdf import PdfReader
+
+    n_pages = len(PdfReader(file_path).pages)
+    workers = _pdf_workers(n_pages)
+
+    if workers == 1:
+        yield from _extract_page_range(file_path, 0, n_pages)
+        return
+
+    # Contiguous page ranges, a few per worker, so each process parses the file only a handful of times
+    step = max(1, n_pages // (4 * workers))
+    starts = range(0, n_pages, step)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        ranges = executor.map(
+            partial(_extract_page_range, file_path),
+            starts,
+            [min(start + step, n_pages) for start in starts]
+        )
+        for page_range in ranges:
+            yield from page_range
 
 def extract_text_from_pdf(file_path: str) -> str:
     try:
-        pdf_reader = PdfReader(file_path)
-
-        text_content = []
-        for page_index, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text_content.append(page_text.strip())
-            except Exception as e:
-                print(f"⚠️ Warning: Cannot extract page {page_index + 1}: {e}")
-                continue
-
-        return "\n\n".join(text_content) if text_content else "Empty PDF"
+        # Join straight from the page stream, without holding a second list of page texts
+        text = "\n\n".join(page for page in iter_pdf_pages(file_path) if page)
+        return text or "Empty PDF"
     except Exception as e:
         print(f"❌ PDF Error: {e}")
         raise
 
 def chunk_text(text: str) -> List[str]:
+    from agno.knowledge.chunking.agentic import AgenticChunking
+    from agno.knowledge.document.base import Document
+
     chunker = AgenticChunking(
-        model=OpenAIChat(id="gpt-4o"),
+        model=chat_model("gpt-4o"),
         max_chunk_size=5000,
     )
 
@@ -47,38 +99,124 @@ def chunk_text(text: str) -> List[str]:
         fallback_size = 1000
         return [text[i:i + fallback_size] for i in range(0, len(text), fallback_size)]
 
-def embed_text(texts: List[str]):
-    if not texts:
-        return []
-    
+def _embedding_batches(texts: List[str]) -> List[List[str]]:
+    """Split texts into request-sized batches, capped by input count and an approximate token budget"""
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = len(text) // 4 + 1
+        if batch and (len(batch) >= EMBED_BATCH_SIZE or batch_tokens + tokens > EMBED_BATCH_TOKENS):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _ordered_embeddings(response, count: int) -> List[List[float]]:
+    # The API documents no ordering guarantee; item.index is the position in the input
+    embeddings = [None] * count
+    for item in response.data:
+        embeddings[item.index] = item.embedding
+    return embeddings
+
+def _embed_batch(batch: List[str]) -> List[List[float]]:
+    for attempt in range(EMBED_RETRIES):
+        try:
+            response = client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+            return _ordered_embeddings(response, len(batch))
+        except Exception as e:
+            if attempt == EMBED_RETRIES - 1:
+                raise
+            print(f"⚠️ Embedding batch of {len(batch)} failed ({e}), retrying...")
+            time.sleep(2 ** attempt)
+
+async def _embed_async(batches: List[List[str]]) -> List[List[float]]:
+    """Send all batches concurrently, at most EMBED_CONCURRENCY requests in flight"""
+    semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async with AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY")) as async_client:
+        async def _one(batch: List[str]) -> List[List[float]]:
+            async with semaphore:
+                for attempt in range(EMBED_RETRIES):
+                    try:
+                        response = await async_client.embeddings.create(input=batch, model=EMBEDDING_MODEL)
+                        return _ordered_embeddings(response, len(batch))
+                    except Exception as e:
+                        if attempt == EMBED_RETRIES - 1:
+                            raise
+                        print(f"⚠️ Embedding batch of {len(batch)} failed ({e}), retrying...")
+                        await asyncio.sleep(2 ** attempt)
+
+        results = await asyncio.gather(*[_one(batch) for batch in batches])
+
+    return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+def _in_event_loop() -> bool:
     try:
-        response = client.embeddings.create(
-            input=texts,
-            model="text-embedding-3-small"
-        )
-        
-        embeddings = [item.embedding for item in response.data]
-        return embeddings
-        
-    except Exception as e:
-        print(f"⚠️ Batch embedding failed: {e}")
-        print("Falling back to individual embeddings...")
-        
-        embeddings = []
-        for text in texts:
-            try:
-                response = client.embeddings.create(
-                    input=text,
-                    model="text-embedding-3-small"
-                )
-                embeddings.append(response.data[0].embedding)
-            except Exception as e:
-                print(f"⚠️ Failed to embed individual text: {e}")
-                embeddings.append([0.0] * 1536)
-        
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    # Batch in length order so each request holds similarly sized texts and the token budget
+    # packs evenly, instead of a few long chunks cutting a batch short; results are put back below
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = _embedding_batches([texts[i] for i in order])
+
+    # asyncio.run can't nest inside a running loop (e.g. called straight from an async route)
+    if len(batches) > 1 and not _in_event_loop():
+        sorted_embeddings = asyncio.run(_embed_async(batches))
+    else:
+        sorted_embeddings = []
+        for batch in batches:
+            sorted_embeddings.extend(_embed_batch(batch))
+
+    embeddings = [None] * len(texts)
+    for position, i in enumerate(order):
+        embeddings[i] = sorted_embeddings[position]
+    return embeddings
+
+def embed_text(texts: List[str]) -> np.ndarray:
+    """Embeddings as one (len(texts), EMBEDDING_DIMENSIONS) float32 array, in input order"""
+    embeddings = np.empty((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    if not texts:
         return embeddings
 
-def extract_entities_from_chunk(chunk: str, chunk_index: int, previous_chunk: str = None, next_chunk: str = None, extraction_agent: Agent = None) -> Dict[str, Any]:
+    # Only texts never embedded before with this model go to the API
+    keys = [embedding_key(EMBEDDING_MODEL, text) for text in texts]
+    cached = get_many(keys)
+
+    misses = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            misses.setdefault(key, text)
+
+    if misses:
+        new_embeddings = dict(zip(misses, np.asarray(_embed_uncached(list(misses.values())), dtype=np.float32)))
+        put_many(new_embeddings.items())
+        cached.update(new_embeddings)
+
+    for i, key in enumerate(keys):
+        embeddings[i] = cached[key]
+    return embeddings
+
+@lru_cache(maxsize=1024)
+def _embed_query_cached(query: str) -> tuple:
+    return tuple(embed_text([query])[0].tolist())
+
+def embed_query(query: str) -> List[float]:
+    """Embedding of a search query, memoized in-process so repeated questions skip the cache lookup and the API"""
+    # Whitespace differences don't change the meaning of a question, so they share one entry
+    return list(_embed_query_cached(" ".join(query.split())))
+
+def build_extraction_prompt(chunk: str, previous_chunk: str = None, next_chunk: str = None) -> str:
+    """Build the extraction prompt for a chunk, including surrounding context"""
     context_parts = []
     
     if previous_chunk:
@@ -89,95 +227,153 @@ def extract_entities_from_chunk(chunk: str, chunk_index: int, previous_chunk: st
     if next_chunk:
         context_parts.append(f"[NEXT CONTEXT]: {next_chunk[:500]}")
     
-    full_context = "\n\n".join(context_parts)
-    
-    additional_instructions = """
-    
-    IMPORTANT CONTEXT INSTRUCTIONS:
-    - You are given the current chunk plus surrounding context (previous/next chunks)
-    - Extract entities and relationships ONLY from the [CURRENT CHUNK TO ANALYZE]
-    - Use the context sections to better understand references, pronouns, and implicit connections
-    - If the current chunk refers to something mentioned in context, use the full proper name
-    
-    Example:
-    [PREVIOUS CONTEXT]: "Bitcoin uses Proof-of-Work consensus..."
-    [CURRENT CHUNK]: "This mechanism prevents double-spending by requiring computational work."
-    [NEXT CONTEXT]: "The network validates each transaction..."
+    # The static context instructions live in the system prompt, so only the chunk text is sent per request
+    return "\n\n".join(context_parts)
+
+def filter_extraction(extracted_data: ExtractedEntities) -> Dict[str, Any]:
+    """Drop low-quality entities and relationships from an extraction result"""
+    # Skip very short names, generic words, bare numbers, measurements and single variables
+    quality_entities = [e for e in (extracted_data.entities or []) if not is_junk_entity(e.name)]
     
-    You should extract:
-    - "Proof-of-Work" (mentioned in previous, referenced as "This mechanism")
-    - "Double-Spending" 
-    - Relationship: "Proof-of-Work" → "prevents" → "Double-Spending"
-    """
+    # Both entities must survive the filter, and the relationship type must not be too generic
+    entity_names = {e.name for e in quality_entities}
+    quality_relationships = [
+        rel for rel in (extracted_data.relationships or [])
+        if rel.from_entity in entity_names
+        and rel.to_entity in entity_names
+        and rel.type.lower() not in GENERIC_REL_TYPES
+    ]
     
+    return {
+        "entities": quality_entities,
+        "relationships": quality_relationships
+    }
+
+async def _extract(async_client: AsyncOpenAI, model_id: str, prompt: str) -> ExtractedEntities:
+    response = await async_client.chat.completions.create(
+        model=model_id,
+        messages=[
+            {"role": "system", "content": EXTRACTION_INSTRUCTIONS},
+            {"role": "user", "content": prompt}
+        ],
+        response_format=EXTRACTION_RESPONSE_FORMAT
+    )
+    return ExtractedEntities.model_validate_json(response.choices[0].message.content)
+
+async def extract_with_fallback(async_client: AsyncOpenAI, prompt: str, chunk_index: int) -> ExtractedEntities:
+    """Try the cheap model first and only pay for the escalation model when its answer is unusable"""
     try:
-        # Create a modified prompt that includes context
-        result = extraction_agent.run(full_context + additional_instructions)
-        
-        # Add quality filtering
-        extracted_data = result.content
-        
-        # Filter out low-quality entities
-        quality_entities = []
-        for entity in (extracted_data.entities or []):
-            # Skip very short names or generic terms
-            if len(entity.name) < 3:
-                continue
-            
-            # Skip common generic words
-            generic_terms = {'the', 'this', 'that', 'these', 'those', 'it', 'its', 
-                           'system', 'method', 'approach', 'technique', 'process'}
-            if entity.name.lower() in generic_terms:
-                continue
-            
-            quality_entities.append(entity)
-        
-        # Filter relationships to ensure both entities exist
-        entity_names = {e.name for e in quality_entities}
-        quality_relationships = []
-        
-        for rel in (extracted_data.relationships or []):
-            # Both entities must exist in our filtered entity list
-            if rel.from_entity in entity_names and rel.to_entity in entity_names:
-                # Check relationship type is not too generic
-                generic_rel_types = {'related', 'connected', 'associated', 'linked', 
-                                    'has', 'uses', 'involves'}
-                if rel.type.lower() not in generic_rel_types:
-                    quality_relationships.append(rel)
-        
-        return {
-            "entities": quality_entities,
-            "relationships": quality_relationships
-        }
-        
+        result = await _extract(async_client, EXTRACTION_MODEL, prompt)
+        if len(result.entities) >= MIN_ENTITIES:
+            return result
+        print(f"  Chunk {chunk_index}: {EXTRACTION_MODEL} found too few entities, escalating to {ESCALATION_MODEL}")
+    except RateLimitError:
+        raise
+    except Exception as e:
+        print(f"  Chunk {chunk_index}: {EXTRACTION_MODEL} failed ({e}), escalating to {ESCALATION_MODEL}")
+
+    return await _extract(async_client, ESCALATION_MODEL, prompt)
+
+async def extract_entities_from_chunk(chunk: str, chunk_index: int, previous_chunk: str = None, next_chunk: str = None, async_client: AsyncOpenAI = None) -> Dict[str, Any]:
+    try:
+        prompt = build_extraction_prompt(chunk, previous_chunk, next_chunk)
+        result = await extract_with_fallback(async_client, prompt, chunk_index)
+        cache_extraction(extraction_key(chunk, previous_chunk, next_chunk), result)
+        return filter_extraction(result)
+    
+    except RateLimitError:
+        # Let adaptive_gather see it so it can shrink the window and retry
+        raise
     except Exception as e:
         print(f"⚠️ Extraction failed on chunk {chunk_index}: {e}")
         return {"entities": [], "relationships": []}
 
-def extract_entities_per_chunk(chunks: List[str]) -> List[Dict[str, Any]]:
-    """Extract entities from each chunk with context awareness"""
-    extraction_agent = entities_extraction_agent()
-    
-    chunk_extractions = []
-    
-    for i, chunk in enumerate(chunks):
-        print(f"\n{'─'*50}")
-        print(f"Processing chunk {i+1}/{len(chunks)}...")
-        print(f"{'─'*50}")
-        
-        # Get surrounding context
-        previous_chunk = chunks[i-1] if i > 0 else None
-        next_chunk = chunks[i+1] if i < len(chunks) - 1 else None
-        
-        # Extract with context
-        data = extract_entities_from_chunk(
-            chunk=chunk,
+async def adaptive_gather(factories: List[Callable[[], Awaitable]], min_batch: int = 2, growth: int = 3, max_batch: int = 32) -> List[Any]:
+    """Like gather(return_exceptions=True), but keeps an in-flight window that grows on success and halves on 429s"""
+    results = [None] * len(factories)
+    queue = deque(range(len(factories)))
+    attempts = [0] * len(factories)
+    in_flight = {}
+    window = min_batch
+    successes = 0
+    backoff = 1.0
+
+    while queue or in_flight:
+        # Top the window up as tasks finish instead of waiting for a whole batch
+        while queue and len(in_flight) < window:
+            i = queue.popleft()
+            in_flight[asyncio.create_task(factories[i]())] = i
+
+        done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+        rate_limited = False
+        for task in done:
+            i = in_flight.pop(task)
+            error = task.exception()
+            if isinstance(error, RateLimitError) and attempts[i] < MAX_RATE_LIMIT_RETRIES:
+                attempts[i] += 1
+                queue.appendleft(i)
+                rate_limited = True
+            else:
+                results[i] = error if error is not None else task.result()
+                successes += error is None
+
+        if rate_limited:
+            window = max(1, window // 2)
+            successes = 0
+            print(f"⚠️ Rate limited, shrinking window to {window} and backing off {backoff:.0f}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+        elif successes >= window and window < max_batch:
+            window = min(max_batch, window * growth)
+            successes = 0
+            backoff = 1.0
+
+    return results
+
+async def extract_batch(chunks: List[str]) -> List[Dict[str, Any]]:
+    """Extract entities from all chunks concurrently, adapting the number in flight to the rate limit"""
+    # Async clients are bound to the running event loop, so each ingestion run opens its own
+    async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def extract_one(i: int) -> Callable[[], Awaitable[Dict[str, Any]]]:
+        return lambda: extract_entities_from_chunk(
+            chunk=chunks[i],
             chunk_index=i,
-            previous_chunk=previous_chunk,
-            next_chunk=next_chunk,
-            extraction_agent=extraction_agent
+            previous_chunk=chunks[i-1] if i > 0 else None,
+            next_chunk=chunks[i+1] if i < len(chunks) - 1 else None,
+            async_client=async_client
         )
-        
+
+    # Chunks seen before with the same context (re-uploads, shared boilerplate) skip the LLM entirely
+    results = [
+        get_cached_extraction(extraction_key(
+            chunk,
+            chunks[i-1] if i > 0 else None,
+            chunks[i+1] if i < len(chunks) - 1 else None
+        ))
+        for i, chunk in enumerate(chunks)
+    ]
+    pending = [i for i, cached in enumerate(results) if cached is None]
+    results = [cached if cached is None else filter_extraction(cached) for cached in results]
+    print(f"✓ Extraction cache: {len(chunks) - len(pending)}/{len(chunks)} chunks already extracted")
+
+    async with async_client:
+        extracted = await adaptive_gather(
+            [extract_one(i) for i in pending],
+            max_batch=MAX_CONCURRENCY
+        )
+
+    for i, data in zip(pending, extracted):
+        results[i] = data
+
+    chunk_extractions = []
+
+    for i, (chunk, data) in enumerate(zip(chunks, results)):
+        if isinstance(data, Exception):
+            print(f"⚠️ Extraction failed on chunk {i}: {data}")
+            data = {"entities": [], "relationships": []}
+
         # Store extraction with chunk reference
         chunk_extractions.append({
             'chunk_index': i,
@@ -185,42 +381,34 @@ def extract_entities_per_chunk(chunks: List[str]) -> List[Dict[str, Any]]:
             'entities': data['entities'],
             'relationships': data['relationships']
         })
-        
-        print(f"✓ Extracted {len(data['entities'])} entities, {len(data['relationships'])} relationships")
-        
-        # Show sample entities for verification
-        if data['entities'][:3]:
-            print(f"  Sample entities: {', '.join([e.name for e in data['entities'][:3]])}")
-        
-        # Show sample relationships for verification
-        if data['relationships'][:2]:
-            print("  Sample relationships:")
-            for rel in data['relationships'][:2]:
-                print(f"    • {rel.from_entity} --[{rel.type}]--> {rel.to_entity}")
+
+    # One summary line instead of several prints per chunk inside the loop
+    print(
+        f"✓ Extracted {sum(len(x['entities']) for x in chunk_extractions)} entities and "
+        f"{sum(len(x['relationships']) for x in chunk_extractions)} relationships from {len(chunks)} chunks"
+    )
     
     return chunk_extractions
 
-def merge_entity_relationships(chunk_extractions: List[Dict]) -> Dict[str, Any]:
-    """Merge entities and relationships across all chunks"""
+def merge_entity_relationships(chunk_extractions: List[Dict], chunk_ids: List[str] = None) -> Dict[str, Any]:
+    """Merge entities and relationships across all chunks; with chunk_ids, also build the entity-to-chunk write rows"""
     entities_map = {}
+    entity_rows = []
     
     relationships_set = set()
     relationships_list = []
     
-    # Process each chunk's extractions
+    # Single pass over the chunks for both entities and relationships
     for extraction in chunk_extractions:
+        chunk_id = chunk_ids[extraction['chunk_index']] if chunk_ids is not None else None
         for entity in extraction['entities']:
-            # Normalize entity name for deduplication
-            normalized_name = entity.name.strip()
-            
-            # Use normalized name as key, but keep original casing
-            if normalized_name.lower() not in [e.lower() for e in entities_map.keys()]:
+            if chunk_id is not None:
+                entity_rows.append({"name": entity.name, "type": entity.type, "chunk_id": chunk_id})
+            # Key on the lowercased name, but keep the first-seen casing
+            normalized_name = entity.name.strip().lower()
+            if normalized_name not in entities_map:
                 entities_map[normalized_name] = entity
-            else:
-                pass
     
-    # Collect all relationships
-    for extraction in chunk_extractions:
         for rel in extraction['relationships']:
             # Normalize relationship tuple for deduplication
             rel_tuple = (
@@ -259,5 +447,6 @@ def merge_entity_relationships(chunk_extractions: List[Dict]) -> Dict[str, Any]:
     
     return {
         'entities': unique_entities,
-        'relationships': relationships_list
+        'relationships': relationships_list,
+        'entity_rows': entity_rows
     }
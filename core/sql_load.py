@@ -1,118 +1,184 @@
+import hashlib
+import json
+import os
 import psycopg2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
 from decimal import Decimal
 from core.agents import sql_schema_agent
+from core.models import GraphSchemaMapping
 from core.sql_processor import get_postgres_schema, fetch_table_data
 from services.neo4j_service import Neo4jService
 from core.pdf_processor import embed_text
 
+SCHEMA_CACHE_DIR = os.getenv("SCHEMA_CACHE_DIR", ".cache/schema")
+
+# Rows buffered per table before embedding: embed_text splits them into request-sized,
+# concurrent batches, so a larger buffer means fewer, fuller API calls
+EMBED_FLUSH_ROWS = int(os.getenv("SQL_EMBED_FLUSH_ROWS", "5000"))
+
+_mapping_cache = {}
+
+def _schema_fingerprint(schema_context: str) -> str:
+    """Hash of tables and their columns only: sample rows change with the data, not the schema"""
+    tables = {}
+    table = None
+    for line in schema_context.splitlines():
+        if line.startswith("--- TABLE: "):
+            table = line[len("--- TABLE: "):].rstrip(" -")
+        elif line.startswith("Columns: ") and table is not None:
+            tables[table] = line[len("Columns: "):]
+
+    canonical = json.dumps(tables, sort_keys=True).encode("utf-8")
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+def get_schema_mapping(schema_context: str) -> GraphSchemaMapping:
+    """Map the schema with the LLM once per distinct schema, caching in memory and on disk"""
+    fingerprint = _schema_fingerprint(schema_context)
+    if fingerprint in _mapping_cache:
+        print(f"✓ Reusing cached schema mapping ({fingerprint})")
+        return _mapping_cache[fingerprint]
+
+    cache_path = os.path.join(SCHEMA_CACHE_DIR, f"{fingerprint}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            mapping = GraphSchemaMapping.model_validate_json(f.read())
+        print(f"✓ Loaded cached schema mapping from {cache_path}")
+    else:
+        agent = sql_schema_agent()
+        mapping = agent.run(schema_context).content
+
+        os.makedirs(SCHEMA_CACHE_DIR, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            f.write(mapping.model_dump_json())
+
+    _mapping_cache[fingerprint] = mapping
+    return mapping
+
 def load_structured_data(db_params: dict, neo4j_service: Neo4jService):
     print("Starting SQL to Graph Pipeline...")
 
     # Step 1: Getting database schema
     print("Step 1: Getting Database Schema...")
-    schema_context = get_postgres_schema(db_params)
+    conn = psycopg2.connect(**db_params)
+    try:
+        schema_context = get_postgres_schema(conn)
+    finally:
+        conn.close()
 
     # Step 2: Semantic Modeling
     print("Step 2: Generating Semantic Graph Mapping with LLM...")
-    agent = sql_schema_agent()
-    mapping_response = agent.run(schema_context)
-    mapping = mapping_response.content
+    mapping = get_schema_mapping(schema_context)
     
     print(f"✓ Generated Mapping: {len(mapping.nodes)} Node Types, {len(mapping.relationships)} Relationship Types")
     
     # Step 3: Labeling Nodes
     print("Step 3: Labeling Graph Nodes...")
 
-    for node_map in mapping.nodes:
-        print(f"  Processing Table: {node_map.source_table} -> Label: :{node_map.target_label}")
+    # Tables are independent, so Postgres reads, embedding calls and Neo4j writes of different tables overlap
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(mapping.nodes)))) as executor:
+        futures = [executor.submit(_load_one_node, node_map, db_params, neo4j_service) for node_map in mapping.nodes]
+        for future in as_completed(futures):
+            future.result()
 
-    for node_map in mapping.nodes:
-        print(f"  Processing Table: {node_map.source_table} -> Label: :{node_map.target_label}")
+    # Step 4: Linking
+    print(" Step 4: Linking Entities...")
+    for rel in mapping.relationships:
+        print(f"  Creating Edge: (:{rel.source_table}) -[:{rel.relationship_type}]-> (:{rel.target_table})")
         
+        try:
+            # Find Source and Target configurations
+            source_node = next(n for n in mapping.nodes if n.source_table == rel.source_table)
+            target_node = next(n for n in mapping.nodes if n.source_table == rel.target_table)
+            
+            # Find the property names the LLM chose
+            source_prop = next(p.target_property for p in source_node.properties if p.column_name == rel.source_column)
+            target_prop = next(p.target_property for p in target_node.properties if p.column_name == rel.target_column)
+
+            neo4j_service.create_structured_relationship(
+                source_node.target_label, source_prop, 
+                target_node.target_label, target_prop, 
+                rel.relationship_type
+            )
+        except StopIteration:
+            print(f"⚠️ Warning: Could not map relationship {rel.relationship_type}")
+            continue
+
+    # Cached retrievals predate the loaded rows
+    neo4j_service.invalidate_retrieval_cache()
+    print("✅ SQL Pipeline Complete!")
+
+def _load_one_node(node_map, db_params: dict, neo4j_service: Neo4jService):
+    """Load one table as nodes of its label, on a connection of its own"""
+    # psycopg2 connections must not be shared between threads
+    conn = psycopg2.connect(**db_params)
+    try:
+        print(f"  Processing Table: {node_map.source_table} -> Label: :{node_map.target_label}")
+    
         pk_prop = "id"
         for prop in node_map.properties:
             if prop.column_name.lower() == 'id': 
                 pk_prop = prop.target_property
                 break
-        
+    
         print(f"    Using Primary Key: {pk_prop}")
 
-        # Get column names
-        conn = psycopg2.connect(**db_params)
-        cur = conn.cursor()
-        cur.execute(f'SELECT * FROM "{node_map.source_table}" LIMIT 0')
-        col_names = [desc[0] for desc in cur.description]
-        conn.close()
-        
         embed_cols = [p.column_name for p in node_map.properties if p.is_embedding_candidate]
-        
+    
         count = 0
         batch_data = []
-        
-        for row in fetch_table_data(db_params, node_map.source_table):
-            row_dict = dict(zip(col_names, row))
+    
+        col_names, rows = fetch_table_data(conn, node_map.source_table)
+        # Resolve each mapped column to its tuple position once per table, not once per row
+        positions = {name: i for i, name in enumerate(col_names)}
+        prop_positions = [
+            (prop_map, positions[prop_map.column_name])
+            for prop_map in node_map.properties
+            if prop_map.column_name in positions
+        ]
+    
+        for row in rows:
             props = {}
             text_to_embed = []
+        
+            for prop_map, position in prop_positions:
+                val = row[position]
             
-            for prop_map in node_map.properties:
-                val = row_dict.get(prop_map.column_name)
-                
                 if val is not None:
-                    if isinstance(val, Decimal):
-                        val = float(val)
-                    
+                    # Neo4j takes neither Decimal nor Python dates; convert them here, in the one pass over each value
+                    if isinstance(val, (Decimal, date)):
+                        val = float(val) if isinstance(val, Decimal) else val.isoformat()
+                
                     props[prop_map.target_property] = val
-                    
+                
                     if prop_map.is_embedding_candidate and isinstance(val, str):
                         text_to_embed.append(f"{prop_map.target_property}: {val}")
-            
+        
             if text_to_embed:
                 props['embedding_text'] = ". ".join(text_to_embed)
-            
+        
             batch_data.append(props)
-            
-            if len(batch_data) >= 100:
+        
+            if len(batch_data) >= EMBED_FLUSH_ROWS:
                 _push_batch(neo4j_service, node_map.target_label, batch_data, embed_cols, pk_prop)
                 batch_data = []
-                
-            count += 1
             
+            count += 1
+        
         if batch_data:
             _push_batch(neo4j_service, node_map.target_label, batch_data, embed_cols, pk_prop)
-            
-        print(f"    ✓ Loaded {count} nodes for {node_map.target_label}")
-
-    # Step 4: Linking
-    print(" Step 4: Linking Entities...")
-    for rel in mapping.relationships:
-        print(f"  Creating Edge: (:{rel.source_table}) -[:{rel.relationship_type}]-> (:{rel.target_table})")
         
-        try:
-            # Find Source and Target configurations
-            source_node = next(n for n in mapping.nodes if n.source_table == rel.source_table)
-            target_node = next(n for n in mapping.nodes if n.source_table == rel.target_table)
-            
-            # Find the property names the LLM chose
-            source_prop = next(p.target_property for p in source_node.properties if p.column_name == rel.source_column)
-            target_prop = next(p.target_property for p in target_node.properties if p.column_name == rel.target_column)
-
-            neo4j_service.create_structured_relationship(
-                source_node.target_label, source_prop, 
-                target_node.target_label, target_prop, 
-                rel.relationship_type
-            )
-        except StopIteration:
-            print(f"⚠️ Warning: Could not map relationship {rel.relationship_type}")
-            continue
-
-    print("✅ SQL Pipeline Complete!")
+        print(f"    ✓ Loaded {count} nodes for {node_map.target_label}")
+    finally:
+        conn.close()
 
 def _push_batch(service, label, data_list, embed_cols, pk_prop):
-    """Batch embed and write"""
+    """Embed the whole batch in one embed_text call, then write it in one transaction"""
     if embed_cols:
         texts = [d['embedding_text'] for d in data_list if 'embedding_text' in d]
         if texts:
-            embeddings = embed_text(texts)
+            # The Neo4j driver takes plain lists, not ndarrays; convert the whole matrix in one call
+            embeddings = embed_text(texts).tolist()
             embed_idx = 0
             for d in data_list:
                 if 'embedding_text' in d:
@@ -120,4 +186,5 @@ def _push_batch(service, label, data_list, embed_cols, pk_prop):
                     del d['embedding_text'] 
                     embed_idx += 1
     
+    # The service slices the rows into UNWIND statements but commits the whole flush in one transaction
     service.create_structured_nodes_batch(label, data_list, pk_prop)
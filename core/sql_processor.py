@@ -1,50 +1,55 @@
-import psycopg2
-from typing import Dict, Any
+from psycopg2 import sql
+from typing import Iterator, List, Tuple
 
-def get_postgres_schema(db_params: Dict[str, Any]):
-    conn = psycopg2.connect(**db_params)
+def get_postgres_schema(conn):
     cursor = conn.cursor()
 
+    # Every table's columns in one round trip instead of one query per table
     cursor.execute("""
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema = 'public'
+        SELECT c.table_name, c.column_name, c.data_type
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = 'public'
+        ORDER BY c.table_name, c.ordinal_position
     """)
-    tables = [row[0] for row in cursor.fetchall()]
+    columns_by_table = {}
+    for table, column, data_type in cursor.fetchall():
+        columns_by_table.setdefault(table, []).append(f"{column} ({data_type})")
 
     schema_summary = ""
 
-    for table in tables:
+    for table, columns in columns_by_table.items():
         schema_summary += f"\n--- TABLE: {table} ---\n"
-        
-        cursor.execute(f"""
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_name = '{table}'
-        """)
-        columns = cursor.fetchall()
-        schema_summary += "Columns: " + ", ".join([f"{c[0]} ({c[1]})" for c in columns]) + "\n"
-
-        cursor.execute(f'SELECT * FROM "{table}" LIMIT 3')
+        schema_summary += "Columns: " + ", ".join(columns) + "\n"
+
+        cursor.execute(sql.SQL("SELECT * FROM {} LIMIT 3").format(sql.Identifier(table)))
         rows = cursor.fetchall()
         schema_summary += "Sample Data:\n"
         for row in rows:
             schema_summary += f"  {str(row)}\n"
 
-    conn.close()
+    cursor.close()
     return schema_summary
 
-def fetch_table_data(db_params: Dict, table_name: str):
-    conn = psycopg2.connect(**db_params)
-    cursor = conn.cursor(name='fetch_large_result')
-    cursor.execute(f'SELECT * FROM "{table_name}"')
-    
-    while True:
-        rows = cursor.fetchmany(1000)
-        if not rows:
-            break
-        for row in rows:
-            yield row
-            
-    cursor.close()
-    conn.close()
+def fetch_table_data(conn, table_name: str) -> Tuple[List[str], Iterator[tuple]]:
+    """Column names plus a row stream from a server-side cursor on the caller's connection"""
+    cursor = conn.cursor(name=f'fetch_{table_name}')
+    # Iterating a named cursor pulls itersize rows per network round trip
+    cursor.itersize = 10000
+    cursor.execute(sql.SQL("SELECT * FROM {}").format(sql.Identifier(table_name)))
+
+    rows = iter(cursor)
+    # A named cursor only has a description once the first rows arrive
+    first = next(rows, None)
+    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+
+    def stream():
+        try:
+            if first is not None:
+                yield first
+                yield from rows
+        finally:
+            cursor.close()
+
+    return columns, stream()
@@ -1,8 +1,22 @@
+import io
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
 import os
-import numpy as np
+
+CSV_CHUNK_SIZE = 50_000
+
+def _to_int(series: pd.Series) -> pd.Series:
+    # Nullable Int64 so missing values stay NULL and integers aren't written as "3.0"
+    return pd.to_numeric(series, errors='coerce').round().astype('Int64')
+
+def copy_dataframe(cursor, table: str, df: pd.DataFrame, columns: list) -> int:
+    """Bulk load the given columns with COPY FROM STDIN; missing values become NULL"""
+    buffer = io.StringIO()
+    df.reindex(columns=columns).to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    return len(df)
 
 def create_tables(cursor):
     create_actors_query = """
@@ -46,46 +60,48 @@ def create_tables(cursor):
     cursor.execute(create_movies_query)
     print("✓ Table 'movies' created!")
 
+def read_csv_chunks(csv_path):
+    """Stream the CSV in fixed-size frames so memory stays flat regardless of file size"""
+    for df in pd.read_csv(csv_path, keep_default_na=False, na_values=['NULL', ''], chunksize=CSV_CHUNK_SIZE):
+        df.columns = df.columns.str.lower().str.replace(' ', '_')
+        yield df
+
+def clean_actors(df):
+    if 'date_of_birth' in df.columns:
+        df['date_of_birth'] = pd.to_datetime(df['date_of_birth'], errors='coerce').dt.strftime('%Y-%m-%d')
+
+    int_cols = ['oscars', 'oscar_nominations', 'bafta', 'bafta_nominations', 'golden_globes', 'golden_globe_nominations']
+    for col in int_cols:
+        if col in df.columns:
+            df[col] = _to_int(df[col])
+    return df
+
+def clean_movies(df):
+    for col in ['released_year', 'meta_score']:
+        if col in df.columns:
+            df[col] = _to_int(df[col])
+        
+    if 'imdb_rating' in df.columns:
+        df['imdb_rating'] = pd.to_numeric(df['imdb_rating'], errors='coerce')
+
+    if 'no_of_votes' in df.columns:
+        df['no_of_votes'] = _to_int(df['no_of_votes'].astype(str).str.replace(',', '', regex=False))
+    return df
+
 def process_actors(conn, csv_path):
     cursor = conn.cursor()
     try:
         print(f"Reading data from {csv_path}...")
-        df = pd.read_csv(csv_path, keep_default_na=False, na_values=['NULL', ''])
-
-        df.columns = df.columns.str.lower().str.replace(' ', '_')
-        
-        if 'date_of_birth' in df.columns:
-            df['date_of_birth'] = pd.to_datetime(df['date_of_birth'], errors='coerce')
+        columns = ['name', 'date_of_birth', 'place_of_birth', 'oscars', 'oscar_nominations', 'bafta', 'bafta_nominations', 'golden_globes', 'golden_globe_nominations']
 
-        int_cols = ['oscars', 'oscar_nominations', 'bafta', 'bafta_nominations', 'golden_globes', 'golden_globe_nominations']
-        for col in int_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce').replace({np.nan: None})
+        count = 0
+        for df in read_csv_chunks(csv_path):
+            count += copy_dataframe(cursor, 'actors', clean_actors(df), columns)
+            print(f"Inserted {count} actors...")
 
-        columns = ['name', 'date_of_birth', 'place_of_birth', 'oscars', 'oscar_nominations', 'bafta', 'bafta_nominations', 'golden_globes', 'golden_globe_nominations']
-        
-        values = []
-        for _, row in df.iterrows():
-            row_values = []
-            for col in columns:
-                val = row.get(col)
-                if pd.isna(val) or val == '' or val == 'NULL':
-                    row_values.append(None)
-                elif isinstance(val, pd.Timestamp):
-                    row_values.append(val.date())
-                else:
-                    row_values.append(val)
-            values.append(tuple(row_values))
-
-        insert_query = f"""
-            INSERT INTO actors ({', '.join(columns)})
-            VALUES %s
-        """
-        
-        print(f"Inserting {len(values)} actors...")
-        execute_values(cursor, insert_query, values)
+        # One commit for the whole file: a failure part-way leaves the table untouched
         conn.commit()
-        print(f"✓ Successfully loaded {len(values)} actors")
+        print(f"✓ Successfully loaded {count} actors")
 
     except Exception as e:
         print(f"✗ Error processing actors: {e}")
@@ -97,47 +113,17 @@ def process_movies(conn, csv_path):
     cursor = conn.cursor()
     try:
         print(f"Reading data from {csv_path}...")
-        df = pd.read_csv(csv_path, keep_default_na=False, na_values=['NULL', ''])
-
-        df.columns = df.columns.str.lower().str.replace(' ', '_')
-
-        if 'released_year' in df.columns:
-            df['released_year'] = pd.to_numeric(df['released_year'], errors='coerce').replace({np.nan: None})
-        
-        if 'meta_score' in df.columns:
-            df['meta_score'] = pd.to_numeric(df['meta_score'], errors='coerce').replace({np.nan: None})
-            
-        if 'imdb_rating' in df.columns:
-            df['imdb_rating'] = pd.to_numeric(df['imdb_rating'], errors='coerce').replace({np.nan: None})
-
-        if 'no_of_votes' in df.columns:
-            df['no_of_votes'] = df['no_of_votes'].astype(str).str.replace(',', '')
-            df['no_of_votes'] = pd.to_numeric(df['no_of_votes'], errors='coerce').replace({np.nan: None})
-
         db_cols = ['poster_link', 'series_title', 'released_year', 'certificate', 'runtime', 'genre', 
                    'imdb_rating', 'overview', 'meta_score', 'director', 'star1', 'star2', 'star3', 'star4', 
                    'no_of_votes', 'gross']
 
-        values = []
-        for _, row in df.iterrows():
-            row_values = []
-            for col in db_cols:
-                val = row.get(col)
-                if pd.isna(val) or val == '' or val == 'NULL':
-                    row_values.append(None)
-                else:
-                    row_values.append(val)
-            values.append(tuple(row_values))
-
-        insert_query = f"""
-            INSERT INTO movies ({', '.join(db_cols)})
-            VALUES %s
-        """
-
-        print(f"Inserting {len(values)} movies...")
-        execute_values(cursor, insert_query, values)
+        count = 0
+        for df in read_csv_chunks(csv_path):
+            count += copy_dataframe(cursor, 'movies', clean_movies(df), db_cols)
+            print(f"Inserted {count} movies...")
+
         conn.commit()
-        print(f"✓ Successfully loaded {len(values)} movies")
+        print(f"✓ Successfully loaded {count} movies")
 
     except Exception as e:
         print(f"✗ Error processing movies: {e}")
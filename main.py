@@ -1,13 +1,25 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from routes.chat import router as chat_router
 from routes.upload import router as upload_router
+from core.agents import http_client
+from services.neo4j_service import get_service
 
 load_dotenv()
 
-app = FastAPI(title="GraphRAG")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The routes share one Neo4jService; connect before serving and release the pool on shutdown
+    service = get_service()
+    yield
+    service.close()
+    http_client.close()
+
+app = FastAPI(title="GraphRAG", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 origins = ["*"]
 app.add_middleware(
@@ -1,4 +1,8 @@
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from core.models import (
     ChatRequest,
     ChatResponse,
@@ -10,21 +14,50 @@ from core.models import (
     StructuredContext,
     StructuredNode
 )
-from services.neo4j_service import Neo4jService
-from core.agents import graphrag_agent, sql_graphrag_agent, label_router_agent
+from services.neo4j_service import get_service
+from core.pdf_processor import embed_query
+from core.agents import graphrag_agent, graphrag_agent_stream, sql_graphrag_agent, label_router_agent
 
 router = APIRouter()
 
-neo4j_service = Neo4jService()
+neo4j_service = get_service()
+
+def _graphrag_context(rag_context: dict) -> GraphRAGContext:
+    return GraphRAGContext(
+        chunks=[
+            RAGChunk(
+                id=c.get("id"),
+                text=c["text"],
+                score=c.get("score")
+            )
+            for c in rag_context["chunks"]
+        ],
+        entities=[
+            RAGEntity(**e)
+            for e in rag_context["entities"]
+        ],
+        relationships=[
+            RAGRelationship(
+                id=r.get("id"),
+                type=r["type"],
+                source=r["from"],
+                target=r["to"],
+                properties=r.get("properties")
+            )
+            for r in rag_context["relationships"]
+        ]
+    )
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest):
     try:
         question = req.question
 
-        rag_context = neo4j_service.graphrag_search(question, top_k=5)
+        # Neo4j and the agent block, so run them on the threadpool to keep the event loop serving requests
+        rag_context = await run_in_threadpool(neo4j_service.graphrag_search, question, top_k=5)
 
-        answer = graphrag_agent(
+        answer = await run_in_threadpool(
+            graphrag_agent,
             question=question,
             context_chunks=[c["text"] for c in rag_context["chunks"]],
             entities=rag_context["entities"],
@@ -33,50 +66,58 @@ async def chat(req: ChatRequest):
 
         return ChatResponse(
             answer=answer,
-            context=GraphRAGContext(
-                chunks=[
-                    RAGChunk(
-                        id=c.get("id"),
-                        text=c["text"],
-                        score=c.get("score")
-                    )
-                    for c in rag_context["chunks"]
-                ],
-                entities=[
-                    RAGEntity(**e)
-                    for e in rag_context["entities"]
-                ],
-                relationships=[
-                    RAGRelationship(
-                        id=r.get("id"),
-                        type=r["type"],
-                        source=r["from"],
-                        target=r["to"],
-                        properties=r.get("properties")
-                    )
-                    for r in rag_context["relationships"]
-                ]
-            )
+            context=_graphrag_context(rag_context)
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """Server-Sent Events: one `data:` event per answer token, then a final `context` event"""
+    try:
+        question = req.question
+
+        rag_context = await run_in_threadpool(neo4j_service.graphrag_search, question, top_k=5)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        async for token in graphrag_agent_stream(
+            question=question,
+            context_chunks=[c["text"] for c in rag_context["chunks"]],
+            entities=rag_context["entities"],
+            relationships=rag_context["relationships"]
+        ):
+            yield f"data: {json.dumps(token)}\n\n"
+
+        yield f"event: context\ndata: {_graphrag_context(rag_context).model_dump_json()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+async def _route_labels(question: str) -> list:
+    all_labels = await run_in_threadpool(neo4j_service.get_all_labels)
+    return await run_in_threadpool(label_router_agent, question, all_labels)
+
 @router.post("/chat/structured", response_model=StructuredChatResponse)
 async def chat_structured(req: ChatRequest):
     try:
-        all_labels = neo4j_service.get_all_labels()
-
-        target_labels = label_router_agent(req.question, all_labels)
+        # The question's embedding doesn't depend on the routed labels, so compute both at once
+        query_embedding, target_labels = await asyncio.gather(
+            run_in_threadpool(embed_query, req.question),
+            _route_labels(req.question)
+        )
         print(f"Router selected: {target_labels}")
 
-        rag_context = neo4j_service.structured_graphrag_search(
+        rag_context = await run_in_threadpool(
+            neo4j_service.structured_graphrag_search,
             query=req.question,
             target_labels=target_labels, 
-            top_k=5
+            top_k=5,
+            query_embedding=query_embedding
         )
 
-        answer = sql_graphrag_agent(req.question, rag_context)
+        answer = await run_in_threadpool(sql_graphrag_agent, req.question, rag_context)
 
         response_context = StructuredContext(
             nodes=[
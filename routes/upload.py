@@ -1,25 +1,33 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import os
 import tempfile
-from services.neo4j_service import Neo4jService
+from services.neo4j_service import get_service
 from core.docs_load import load_pipeline
 from core.models import UploadResponse
 
 router = APIRouter()
-neo4j_service = Neo4jService()
+neo4j_service = get_service()
+
+UPLOAD_CHUNK_SIZE = 1 << 20
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_pdf(file: UploadFile = File(...)):
-    if file.content_type != "application/pdf":
+    if (file.content_type or "").lower() != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
+    tmp_path = None
     try:
-        # Save temporarily
+        # Save temporarily, 1MB at a time so the whole PDF is never held in memory
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            content = await file.read()
-            tmp.write(content)
             tmp_path = tmp.name
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                tmp.write(chunk)
+            tmp.flush()
         
-        result = load_pipeline(
+        # The pipeline drives its own event loop for extraction, so keep it off the server loop
+        result = await run_in_threadpool(
+            load_pipeline,
             pdf_path=tmp_path,
             filename=file.filename,
             neo4j_service=neo4j_service
@@ -29,3 +37,6 @@ async def upload_pdf(file: UploadFile = File(...)):
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
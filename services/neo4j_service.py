@@ -1,15 +1,235 @@
 import os
 import time
-from neo4j import GraphDatabase
-from core.pdf_processor import embed_text
-from typing import List, Dict
+import atexit
+import functools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from neo4j import GraphDatabase, Result, RoutingControl
+from neo4j.exceptions import ClientError
+from core.pdf_processor import embed_query
+from typing import Callable, List, Dict
 import re
+import string
+
+# Rows per UNWIND statement: large enough to amortize round trips, small enough for one transaction
+BULK_BATCH_SIZE = 1000
+WRITE_WORKERS = int(os.getenv("NEO4J_WRITE_WORKERS", "8"))
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+# Retrieval results per normalized question; loads invalidate the cache, the TTL bounds staleness from other writers
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+# HNSW build settings for new vector indexes (denser graph for 1536-d embeddings), and how many
+# candidates each vector query explores before the top_k are kept; raising it trades latency for recall
+HNSW_M = int(os.getenv("VECTOR_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "200"))
+VECTOR_EF_SEARCH = int(os.getenv("VECTOR_EF_SEARCH", "100"))
+
+# Most relationships returned as context for one question
+RELATIONSHIP_LIMIT = 50
+
+# Relationship labels keep only A-Z and 0-9; everything else in Latin-1 maps to '_'
+_REL_TYPE_CHARS = set(string.ascii_uppercase + string.digits)
+_REL_TYPE_TRANS = str.maketrans({chr(c): '_' for c in range(256) if chr(c) not in _REL_TYPE_CHARS})
+_NON_REL_TYPE_CHARS = re.compile(r'[^A-Z0-9_]')
+
+# Static Cypher lives in module constants, so every call sends byte-identical text that hits the plan cache
+# db.index.vector.queryNodes yields its hits best-first, so the queries below LIMIT them without re-sorting
+CREATE_DOCUMENT_QUERY = """
+    MERGE (d:Document {id: $doc_id})
+    SET d.filename = $filename,
+        d.created_at = datetime()
+"""
+
+# Chunks are written even when their document is missing; only the HAS_CHUNK link depends on it
+CREATE_CHUNKS_QUERY = """
+    UNWIND $rows AS row
+    MERGE (c:Chunk {id: row.id})
+    SET c.text = row.text,
+        c.index = row.index
+    WITH c, row
+    OPTIONAL MATCH (d:Document {id: $doc_id})
+    SET c.filename = d.filename
+    FOREACH (doc IN CASE WHEN d IS NULL THEN [] ELSE [d] END | MERGE (doc)-[:HAS_CHUNK]->(c))
+    WITH c, row
+    CALL db.create.setNodeVectorProperty(c, 'embedding', row.embedding)
+"""
+
+LINK_CHUNKS_QUERY = """
+    UNWIND range(0, size($ids) - 2) AS i
+    MATCH (c1:Chunk {id: $ids[i]})
+    MATCH (c2:Chunk {id: $ids[i + 1]})
+    MERGE (c1)-[:NEXT]->(c2)
+"""
+
+MERGE_ENTITIES_QUERY = """
+    UNWIND $rows AS row
+    MERGE (e:Entity {name_lower: row.name_lower})
+    ON CREATE SET e.name = row.name
+    SET e.type = row.type
+"""
+
+LINK_ENTITIES_QUERY = """
+    UNWIND $chunks AS chunk
+    MATCH (c:Chunk {id: chunk.id})
+    UNWIND chunk.names AS name_lower
+    MATCH (e:Entity {name_lower: name_lower})
+    MERGE (e)-[:EXTRACTED_FROM]->(c)
+"""
+
+VECTOR_SEARCH_QUERY = """
+    CALL db.index.vector.queryNodes('chunk_embeddings', $candidates, $query_embedding)
+    YIELD node AS c, score
+    WITH c, score
+    LIMIT $top_k
+    MATCH (c)<-[:HAS_CHUNK]-(d:Document)
+    RETURN c.id AS chunk_id, c.text AS text, c.index AS chunk_index,
+           d.id AS doc_id, d.filename AS filename, score
+    ORDER BY score DESC
+"""
+
+CHUNK_ENTITIES_QUERY = """
+    MATCH (e:Entity)-[:EXTRACTED_FROM]->(c:Chunk)
+    WHERE c.id IN $chunk_ids
+    RETURN DISTINCT e.name AS name, e.type AS type
+"""
+
+# Vector hits, their entities and the entities' relationships in one round trip
+GRAPHRAG_SEARCH_QUERY = """
+    CALL db.index.vector.queryNodes('chunk_embeddings', $candidates, $query_embedding)
+    YIELD node AS c, score
+    WITH c, score
+    LIMIT $top_k
+    WITH collect({
+        text: c.text,
+        score: score,
+        filename: coalesce(c.filename, head([(c)<-[:HAS_CHUNK]-(d:Document) | d.filename]))
+    }) AS chunks, collect(c) AS chunk_nodes
+    CALL {
+        WITH chunk_nodes
+        UNWIND chunk_nodes AS c
+        MATCH (e:Entity)-[:EXTRACTED_FROM]->(c)
+        WITH DISTINCT e
+        RETURN collect({name: e.name, type: e.type}) AS entities, collect(e) AS entity_nodes
+    }
+    CALL {
+        WITH entity_nodes
+        UNWIND entity_nodes AS e
+        MATCH (e)-[r]-(:Entity)
+        WITH DISTINCT r
+        LIMIT $relationship_limit
+        RETURN collect({from: startNode(r).name, type: type(r), to: endNode(r).name}) AS relationships
+    }
+    RETURN chunks, entities, relationships
+"""
+
+ENTITY_NEIGHBOURS_QUERY = """
+    UNWIND $entity_names AS name
+    MATCH (a:Entity {name: name})-[r]-(b:Entity)
+    RETURN DISTINCT
+        startNode(r).name AS from_entity,
+        type(r) AS rel_type,
+        endNode(r).name AS to_entity,
+        b.name AS neighbour
+    LIMIT $limit
+"""
+
+STRUCTURED_NEIGHBOURS_QUERY = """
+    MATCH (start_node)
+    WHERE start_node.id IN $ids
+    MATCH (start_node)-[r]-(connected_node)
+    RETURN
+        labels(start_node)[0] as start_type,
+        start_node {.name, .title, .series_title, .full_nm} as start_props,
+        type(r) as rel_type,
+        labels(connected_node)[0] as end_type,
+        connected_node {.name, .title, .series_title, .full_nm} as end_props
+    LIMIT 50
+"""
+
+@functools.lru_cache(maxsize=1024)
+def normalize_rel_type(rel_type: str) -> str:
+    """Map an LLM relationship type onto a safe Cypher label; extraction reuses a few dozen types thousands of times"""
+    if not rel_type:
+        return "RELATED"
+
+    s = rel_type.upper().translate(_REL_TYPE_TRANS)
+    if not s.isascii():
+        # The table only covers Latin-1; anything beyond it takes the regex path
+        s = _NON_REL_TYPE_CHARS.sub('_', s)
+    # Collapse runs of '_' and trim them from both ends in one split/join
+    s = '_'.join(filter(None, s.split('_')))
+    if not s:
+        return "RELATED"
+    if s[0].isdigit():
+        s = "REL_" + s
+    return s
+
+@functools.lru_cache(maxsize=256)
+def _relationship_query(rel_label: str) -> str:
+    """UNWIND statement for one normalized label, built once so every batch reuses the same text"""
+    return f"""
+        UNWIND $rows AS row
+        MATCH (e1:Entity {{name_lower: row.from_lower}})
+        MATCH (e2:Entity {{name_lower: row.to_lower}})
+        MERGE (e1)-[r:{rel_label}]->(e2)
+        SET r.llm_type = row.llm_type
+    """
+
+@functools.lru_cache(maxsize=32)
+def _structured_search_query(label_count: int) -> str:
+    """One vector lookup per label (UNION ALL), then the hits' neighbours, in a single statement"""
+    # Index names and labels are parameters, so the text only varies with how many labels are searched
+    branches = "\n        UNION ALL".join(
+        f"""
+        CALL db.index.vector.queryNodes($indexes[{i}], $candidates, $query_embedding)
+        YIELD node, score
+        WITH node, score
+        LIMIT $top_k
+        RETURN $labels[{i}] AS label, node, score"""
+        for i in range(label_count)
+    )
+    return f"""
+    CALL {{{branches}
+    }}
+    WITH collect({{label: label, data: node {{.*, embedding: null}}, score: score}}) AS hits,
+         [n IN collect(node) WHERE n.id IS NOT NULL | n.id] AS ids
+    CALL {{
+        WITH ids
+        MATCH (start_node)
+        WHERE start_node.id IN ids
+        MATCH (start_node)-[r]-(connected_node)
+        WITH start_node, r, connected_node
+        LIMIT 50
+        RETURN collect({{
+            start_type: labels(start_node)[0],
+            start_props: start_node {{.name, .title, .series_title, .full_nm}},
+            rel_type: type(r),
+            end_type: labels(connected_node)[0],
+            end_props: connected_node {{.name, .title, .series_title, .full_nm}}
+        }}) AS relationships
+    }}
+    RETURN hits, relationships
+    """
 
 class Neo4jService:
     def __init__(self):
         self.driver = None
+        self._retrieval_cache = OrderedDict()
+        self._retrieval_lock = threading.Lock()
+        # Structured labels whose constraint / vector index DDL already ran in this process
+        self._constrained = set()
+        self._vector_indexed = set()
+        # (expiry, names) of the online vector indexes, so routed labels without one are skipped
+        self._vector_index_names = None
         self._connect()
         self._setup_vector_index()
+        self._setup_constraints()
+        # Before any load, so every MERGE/MATCH on these keys is an index lookup rather than a label scan
+        self.create_indexes()
     
     def _connect(self):
         """Connect to Neo4j with retry logic"""
@@ -24,10 +244,11 @@ class Neo4jService:
             try:
                 self.driver = GraphDatabase.driver(
                     neo4j_uri,
-                    auth=(neo4j_user, neo4j_password)
+                    auth=(neo4j_user, neo4j_password),
+                    max_connection_pool_size=32,
+                    connection_acquisition_timeout=60
                 )
-                with self.driver.session() as session:
-                    session.run("RETURN 1")
+                self.driver.verify_connectivity()
                 print("✅ Connected to Neo4j")
                 break
             except Exception as e:
@@ -40,199 +261,298 @@ class Neo4jService:
     
     def _setup_vector_index(self):
         """Create vector index for semantic search"""
-        with self.driver.session() as session:
+        try:
+            self._write(f"""
+                CREATE VECTOR INDEX chunk_embeddings IF NOT EXISTS
+                FOR (c:Chunk)
+                ON c.embedding
+                OPTIONS {{indexConfig: {{
+                    `vector.dimensions`: 1536,
+                    `vector.similarity_function`: 'cosine',
+                    `vector.quantization.enabled`: true,
+                    `vector.hnsw.m`: {HNSW_M},
+                    `vector.hnsw.ef_construction`: {HNSW_EF_CONSTRUCTION}
+                }}}}
+            """)
+            print("✅ Vector index created/verified")
+        except Exception as e:
+            print(f"⚠️ Vector index setup: {e}")
+    
+    def _setup_constraints(self):
+        """Unique keys for every MERGE hot path, so each upsert is an index lookup with a per-key lock"""
+        # Plain indexes from older versions sit on the same properties and would block the constraints
+        for index_name in ("document_id", "chunk_id"):
             try:
-                session.run("""
-                    CREATE VECTOR INDEX chunk_embeddings IF NOT EXISTS
-                    FOR (c:Chunk)
-                    ON c.embedding
-                    OPTIONS {indexConfig: {
-                        `vector.dimensions`: 1536,
-                        `vector.similarity_function`: 'cosine'
-                    }}
-                """)
-                print("✅ Vector index created/verified")
+                self._write(f"DROP INDEX {index_name} IF EXISTS")
             except Exception as e:
-                print(f"⚠️ Vector index setup: {e}")
-    
+                print(f"⚠️ Index cleanup ({index_name}): {e}")
+
+        # Entities written before the name_lower key would otherwise be duplicated on their next MERGE
+        try:
+            self._write("MATCH (e:Entity) WHERE e.name_lower IS NULL SET e.name_lower = toLower(trim(e.name))")
+        except Exception as e:
+            print(f"⚠️ Entity key backfill: {e}")
+
+        constraints = {
+            "entity_name_lower": "FOR (e:Entity) REQUIRE e.name_lower IS UNIQUE",
+            "document_id_unique": "FOR (d:Document) REQUIRE d.id IS UNIQUE",
+            "chunk_id_unique": "FOR (c:Chunk) REQUIRE c.id IS UNIQUE"
+        }
+        for name, definition in constraints.items():
+            try:
+                self._write(f"CREATE CONSTRAINT {name} IF NOT EXISTS {definition}")
+            except Exception as e:
+                print(f"⚠️ Constraint setup ({name}): {e}")
+
+    def session(self):
+        """A session for callers that group several writes into their own transactions"""
+        return self.driver.session(database=NEO4J_DATABASE)
+
+    def _read(self, query: str, **params):
+        """Run a read in a managed transaction (retried on transient errors) and return its records"""
+        records, _, _ = self.driver.execute_query(query, params, database_=NEO4J_DATABASE, routing_=RoutingControl.READ)
+        return records
+
+    def _read_data(self, query: str, **params) -> List[Dict]:
+        """Like _read, but the driver builds plain dicts as it consumes the stream"""
+        return self.driver.execute_query(
+            query, params, database_=NEO4J_DATABASE, routing_=RoutingControl.READ, result_transformer_=Result.data
+        )
+
+    def _write(self, query: str, **params):
+        """Run a single write statement in a managed transaction, retried on transient errors"""
+        self.driver.execute_query(query, params, database_=NEO4J_DATABASE, routing_=RoutingControl.WRITE)
+
+    @contextmanager
+    def transaction(self):
+        """One explicit write transaction for callers grouping many single-row writes; commits on clean exit"""
+        with self.session() as session:
+            with session.begin_transaction() as tx:
+                yield tx
+                tx.commit()
+
+    @contextmanager
+    def _writer(self, tx=None):
+        """The caller's transaction if one is given, otherwise a fresh auto-commit session"""
+        if tx is not None:
+            yield tx
+        else:
+            with self.session() as session:
+                yield session
+
+    def write_partitioned(self, write: Callable, rows: List[Dict], key: Callable[[Dict], str]):
+        """Run write(rows, tx=...) concurrently over hash partitions of rows, one managed transaction each"""
+        # Rows sharing a key land in the same partition, which cuts lock contention between workers but
+        # doesn't remove it: entity rows still share chunks, relationship rows still share target entities
+        partitions = [[] for _ in range(WRITE_WORKERS)]
+        for row in rows:
+            partitions[hash(key(row)) % WRITE_WORKERS].append(row)
+        partitions = [partition for partition in partitions if partition]
+
+        def run(partition: List[Dict]):
+            # The remaining conflicts surface as deadlocks, which execute_write retries as transient errors
+            with self.session() as session:
+                session.execute_write(lambda tx: write(partition, tx=tx))
+
+        with ThreadPoolExecutor(max_workers=max(1, len(partitions))) as executor:
+            list(executor.map(run, partitions))
+
     def close(self):
         """Close Neo4j connection"""
         if self.driver:
             self.driver.close()
+            self.driver = None
             print("❌ Neo4j connection closed")
     
     def clear_graph(self):
         """Clear all nodes and relationships from the graph"""
-        with self.driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
-            print("🗑️ Graph cleared")
+        self._write("MATCH (n) DETACH DELETE n")
+        self.invalidate_retrieval_cache()
+        print("🗑️ Graph cleared")
+
+    def invalidate_retrieval_cache(self):
+        """Drop cached graphrag_search results, e.g. after new data is loaded"""
+        with self._retrieval_lock:
+            self._retrieval_cache.clear()
+        self._vector_index_names = None
 
     def _normalize_rel_type(self, rel_type: str) -> str:
-        if not rel_type:
-            return "RELATED"
-
-        s = rel_type.strip().upper()
-        s = re.sub(r'[^A-Z0-9]+', '_', s)
-        s = s.strip('_')
-        if not s:
-            return "RELATED"
-        if s[0].isdigit():
-            s = "REL_" + s
-        return s
+        return normalize_rel_type(rel_type)
     
     def create_indexes(self):
         """Create indexes for better performance"""
-        with self.driver.session() as session:
-            session.run("CREATE INDEX document_id IF NOT EXISTS FOR (d:Document) ON (d.id)")
-            session.run("CREATE INDEX entity_name IF NOT EXISTS FOR (e:Entity) ON (e.name)")
-            session.run("CREATE INDEX chunk_id IF NOT EXISTS FOR (c:Chunk) ON (c.id)")
-            print("✅ Indexes created")
+        # Document and Chunk ids are covered by their unique constraints; names are matched on read
+        self._write("CREATE INDEX entity_name IF NOT EXISTS FOR (e:Entity) ON (e.name)")
+        print("✅ Indexes created")
     
-    def create_document_node(self, doc_id: str, filename: str, content: str):
-        """Create a document node in the graph"""
-        with self.driver.session() as session:
-            session.run("""
-                MERGE (d:Document {id: $doc_id})
-                SET d.filename = $filename,
-                    d.content = $content,
-                    d.created_at = datetime()
-            """, doc_id=doc_id, filename=filename, content=content)
-
-    def create_chunk_node(self, chunk_id: str, text: str, chunk_index: int, embedding: List[float], doc_id: str):
+    def create_document_node(self, doc_id: str, filename: str, tx=None):
+        """Create a document node in the graph; its text lives only in its ordered Chunk nodes"""
+        with self._writer(tx) as session:
+            session.run(CREATE_DOCUMENT_QUERY, doc_id=doc_id, filename=filename)
+
+    def create_chunk_node(self, chunk_id: str, text: str, chunk_index: int, embedding: List[float], doc_id: str, tx=None):
         """Create chunk node with embedding for vector search"""
-        with self.driver.session() as session:
-            session.run("""
-                MERGE (c:Chunk {id: $chunk_id})
-                SET c.text = $text,
-                    c.index = $chunk_index,
-                    c.embedding = $embedding
-                WITH c
-                MATCH (d:Document {id: $doc_id})
-                MERGE (d)-[:HAS_CHUNK]->(c)
-            """, chunk_id=chunk_id, text=text, chunk_index=chunk_index, 
-                 embedding=embedding, doc_id=doc_id)
+        self.create_chunk_nodes_bulk(
+            [{"id": chunk_id, "text": text, "index": chunk_index, "embedding": embedding}], doc_id, tx=tx
+        )
     
-    def create_chunk_relationships(self, chunk_ids: List[str]):
+    def create_chunk_nodes_bulk(self, rows: List[Dict], doc_id: str, tx=None):
+        """Create chunk nodes from {id, text, index, embedding} rows and attach them to their document"""
+        with self._writer(tx) as session:
+            for start in range(0, len(rows), BULK_BATCH_SIZE):
+                session.run(CREATE_CHUNKS_QUERY, rows=rows[start:start + BULK_BATCH_SIZE], doc_id=doc_id)
+
+    def create_chunk_relationships(self, chunk_ids: List[str], tx=None):
         """Create NEXT relationships between consecutive chunks"""
-        with self.driver.session() as session:
-            for i in range(len(chunk_ids) - 1):
-                session.run("""
-                    MATCH (c1:Chunk {id: $chunk_id_1})
-                    MATCH (c2:Chunk {id: $chunk_id_2})
-                    MERGE (c1)-[:NEXT]->(c2)
-                """, chunk_id_1=chunk_ids[i], chunk_id_2=chunk_ids[i + 1])
+        # One statement for the whole document instead of a round-trip per pair; on its own it
+        # runs as a managed transaction, so transient failures are retried
+        if tx is not None:
+            tx.run(LINK_CHUNKS_QUERY, ids=chunk_ids)
+        else:
+            self._write(LINK_CHUNKS_QUERY, ids=chunk_ids)
         
         print(f"✓ Created {len(chunk_ids) - 1} NEXT relationships between chunks")
 
-    def create_entity(self, entity_name: str, entity_type: str, chunk_id: str):
+    def create_entity(self, entity_name: str, entity_type: str, chunk_id: str, tx=None):
         """Create an entity node and link it to the chunk it was extracted from"""
-        with self.driver.session() as session:
-            session.run("""
-                MERGE (e:Entity {name: $name})
-                SET e.type = $type
-                WITH e
-                MATCH (c:Chunk {id: $chunk_id})
-                MERGE (e)-[:EXTRACTED_FROM]->(c)
-            """, name=entity_name, type=entity_type, chunk_id=chunk_id)
+        self.create_entities_bulk([{"name": entity_name, "type": entity_type, "chunk_id": chunk_id}], tx=tx)
     
-    def create_relationship(self, from_entity: str, to_entity: str, rel_type: str):
-        """Create relationship between entities"""
-        rel_label = self._normalize_rel_type(rel_type)
+    def create_entities_bulk(self, rows: List[Dict], tx=None):
+        """Create entity nodes from {name, type, chunk_id} rows and link them to their chunks"""
+        # Names differing only in case or surrounding whitespace MERGE into the same node.
+        # Each distinct entity is MERGEd once (first-seen name and type), however many chunks mention it
+        unique = {}
+        by_chunk = {}
+        for row in rows:
+            name_lower = row["name"].strip().lower()
+            unique.setdefault(name_lower, {"name": row["name"], "name_lower": name_lower, "type": row["type"]})
+            by_chunk.setdefault(row["chunk_id"], []).append(name_lower)
+        entities = list(unique.values())
+        # Links are grouped per chunk so each chunk is matched once per statement, not once per entity
+        links = [{"id": chunk_id, "names": names} for chunk_id, names in by_chunk.items()]
 
-        cypher = f"""
-            MATCH (e1:Entity {{name: $from_name}})
-            MATCH (e2:Entity {{name: $to_name}})
-            MERGE (e1)-[r:{rel_label}]->(e2)
-            SET r.llm_type = $rel_type
-        """
+        with self._writer(tx) as session:
+            for start in range(0, len(entities), BULK_BATCH_SIZE):
+                session.run(MERGE_ENTITIES_QUERY, rows=entities[start:start + BULK_BATCH_SIZE])
+
+            for start in range(0, len(links), BULK_BATCH_SIZE):
+                session.run(LINK_ENTITIES_QUERY, chunks=links[start:start + BULK_BATCH_SIZE])
+
+    def create_relationships_bulk(self, relationships: List[Dict], tx=None):
+        """Create relationships from {from, to, type} rows, one UNWIND per relationship label"""
+        # Cypher can't parameterize a relationship type, so group rows by their normalized label.
+        # Rows that MERGE the same edge are collapsed here instead of each costing a MERGE;
+        # the last llm_type wins, as it would with successive SETs
+        by_label = {}
+        for rel in relationships:
+            from_lower = rel["from"].strip().lower()
+            to_lower = rel["to"].strip().lower()
+            by_label.setdefault(self._normalize_rel_type(rel["type"]), {})[(from_lower, to_lower)] = {
+                "from_lower": from_lower,
+                "to_lower": to_lower,
+                "llm_type": rel["type"]
+            }
 
-        with self.driver.session() as session:
-            session.run(
-                cypher,
-                from_name=from_entity,
-                to_name=to_entity,
-                rel_type=rel_type,
-            )
+        with self._writer(tx) as session:
+            for rel_label, edges in by_label.items():
+                rows = list(edges.values())
+                query = _relationship_query(rel_label)
+                for start in range(0, len(rows), BULK_BATCH_SIZE):
+                    session.run(query, rows=rows[start:start + BULK_BATCH_SIZE])
+
+    def create_relationship(self, from_entity: str, to_entity: str, rel_type: str, tx=None):
+        """Create relationship between entities"""
+        self.create_relationships_bulk([{"from": from_entity, "to": to_entity, "type": rel_type}], tx=tx)
     
-    def vector_search(self, query_embedding: List[float], top_k: int = 5) -> List[Dict]:
+    def vector_search(self, query_embedding: List[float], top_k: int = 5, ef_search: int = VECTOR_EF_SEARCH) -> List[Dict]:
         """Perform vector similarity search using Neo4j's vector index"""
-        with self.driver.session() as session:
-            result = session.run("""
-                CALL db.index.vector.queryNodes('chunk_embeddings', $top_k, $query_embedding)
-                YIELD node AS c, score
-                MATCH (c)<-[:HAS_CHUNK]-(d:Document)
-                RETURN c.id AS chunk_id, c.text AS text, c.index AS chunk_index,
-                       d.id AS doc_id, d.filename AS filename, score
-                ORDER BY score DESC
-            """, query_embedding=query_embedding, top_k=top_k)
-            
-            return [dict(record) for record in result]
+        return self._read_data(
+            VECTOR_SEARCH_QUERY,
+            query_embedding=query_embedding, top_k=top_k, candidates=max(top_k, ef_search)
+        )
     
     def get_entities_from_chunks(self, chunk_ids: List[str]) -> List[Dict]:
         """Get all entities extracted from specific chunks"""
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (e:Entity)-[:EXTRACTED_FROM]->(c:Chunk)
-                WHERE c.id IN $chunk_ids
-                RETURN DISTINCT e.name AS name, e.type AS type
-            """, chunk_ids=chunk_ids)
-            
-            return [dict(record) for record in result]
+        return self._read_data(CHUNK_ENTITIES_QUERY, chunk_ids=chunk_ids)
     
     def get_entity_relationships(self, entity_names: List[str], max_hops: int = 2) -> List[Dict]:
         """Get relationships between entities, following connections up to max_hops"""
-        with self.driver.session() as session:
-            result = session.run(f"""
-                MATCH (e:Entity)
-                WHERE e.name IN $entity_names
-                MATCH path = (e)-[r*1..{max_hops}]-(connected:Entity)
-                RETURN DISTINCT
-                    startNode(relationships(path)[0]).name AS from_entity,
-                    type(relationships(path)[0]) AS rel_type,
-                    endNode(relationships(path)[0]).name AS to_entity
-                LIMIT 50
-            """, entity_names=entity_names)
+        # One index-seeded single-hop query per hop, expanding only from names not seen yet;
+        # a variable-length path would enumerate every 2-hop path just to keep its first edge
+        relationships = {}
+        seen = set(entity_names)
+        frontier = list(entity_names)
+        for _ in range(max_hops):
+            if not frontier or len(relationships) >= RELATIONSHIP_LIMIT:
+                break
+            records = self._read(ENTITY_NEIGHBOURS_QUERY, entity_names=frontier, limit=RELATIONSHIP_LIMIT)
             
-            relationships = []
-            for record in result:
-                relationships.append({
+            frontier = []
+            for record in records:
+                relationships.setdefault((record['from_entity'], record['rel_type'], record['to_entity']), {
                     'from': record['from_entity'],
                     'type': record['rel_type'],
                     'to': record['to_entity']
                 })
-            
-            return relationships
+                if record['neighbour'] not in seen:
+                    seen.add(record['neighbour'])
+                    frontier.append(record['neighbour'])
+        
+        return list(relationships.values())[:RELATIONSHIP_LIMIT]
     
+    def _cached_retrieval(self, key):
+        with self._retrieval_lock:
+            entry = self._retrieval_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._retrieval_cache[key]
+                return None
+            self._retrieval_cache.move_to_end(key)
+            return entry[1], entry[2]
+
+    def _cache_retrieval(self, key, chunks: List[Dict], entities: List[Dict]):
+        with self._retrieval_lock:
+            self._retrieval_cache[key] = (time.monotonic() + RETRIEVAL_CACHE_TTL, chunks, entities)
+            self._retrieval_cache.move_to_end(key)
+            if len(self._retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                self._retrieval_cache.popitem(last=False)
+
     def graphrag_search(self, query: str, top_k: int = 5) -> Dict:
         """Complete GraphRAG search that combines Vector search, Entity extraction and Relationships"""
-        query_embedding = embed_text([query])[0]
-        vector_results = self.vector_search(query_embedding, top_k)
+        # Repeated questions skip the query embedding and the vector lookup; only the relationships are re-read
+        key = (" ".join(query.lower().split()), top_k)
+        cached = self._cached_retrieval(key)
+        if cached is not None:
+            chunks, entities = cached
+            entity_names = [e['name'] for e in entities]
+            return {
+                'chunks': chunks,
+                'entities': entities,
+                'relationships': self.get_entity_relationships(entity_names, max_hops=1) if entity_names else []
+            }
+
+        query_embedding = embed_query(query)
+        records = self._read(
+            GRAPHRAG_SEARCH_QUERY,
+            query_embedding=query_embedding, top_k=top_k, candidates=max(top_k, VECTOR_EF_SEARCH),
+            relationship_limit=RELATIONSHIP_LIMIT
+        )
+        record = records[0]
         
-        if not vector_results:
+        if not record['chunks']:
             return {
                 'chunks': [],
                 'entities': [],
                 'relationships': []
             }
         
-        chunks = [
-            {
-                'text': r['text'],
-                'score': r['score'],
-                'filename': r['filename']
-             } 
-                  for r in vector_results]
-        chunk_ids = [r['chunk_id'] for r in vector_results]
-        
-        entities = self.get_entities_from_chunks(chunk_ids)
-        
-        entity_names = [e['name'] for e in entities]
-        relationships = self.get_entity_relationships(entity_names, max_hops=2) if entity_names else []
+        self._cache_retrieval(key, record['chunks'], record['entities'])
         
         return {
-            'chunks': chunks,
-            'entities': entities,
-            'relationships': relationships
+            'chunks': record['chunks'],
+            'entities': record['entities'],
+            'relationships': record['relationships']
         }
 
     def create_structured_nodes_batch(self, label: str, props_list: List[Dict], primary_key: str):
@@ -243,38 +563,46 @@ class Neo4jService:
         if 'embedding' in props_list[0]:
             self._ensure_vector_index(label)
         
-        with self.driver.session() as session:
+        if (label, primary_key) not in self._constrained:
             try:
                 constraint_name = f"constraint_{label.lower()}_{primary_key}"
-                session.run(f"""
+                self._write(f"""
                     CREATE CONSTRAINT {constraint_name} IF NOT EXISTS
                     FOR (n:`{label}`) REQUIRE n.`{primary_key}` IS UNIQUE
                 """)
             except Exception as e:
                 print(f"⚠️ Constraint warning: {e}")
+            # Marked even on failure: retrying the same DDL every batch would fail the same way
+            self._constrained.add((label, primary_key))
 
+        # The embedding is written apart from the other properties so it is stored as a float32 vector
         query = f"""
         UNWIND $batch AS row
-        MERGE (n:`{label}` {{ `{primary_key}`: row.`{primary_key}` }})
-        SET n += row
+        MERGE (n:`{label}` {{ `{primary_key}`: row.props.`{primary_key}` }})
+        SET n += row.props
+        WITH n, row
+        WHERE row.embedding IS NOT NULL
+        CALL db.create.setNodeVectorProperty(n, 'embedding', row.embedding)
         """
         
-        from datetime import date, datetime
+        # Values arrive Neo4j-ready (the SQL loader converts dates and decimals), so only the embedding is split off
         cleaned_batch = []
         for row in props_list:
-            new_row = {}
-            for k, v in row.items():
-                if isinstance(v, (date, datetime)):
-                    new_row[k] = v.isoformat()
-                else:
-                    new_row[k] = v
-            cleaned_batch.append(new_row)
+            props = dict(row)
+            cleaned_batch.append({"props": props, "embedding": props.pop('embedding', None)})
 
-        with self.driver.session() as session:
-            session.run(query, batch=cleaned_batch)
+        # All slices commit together: one managed transaction (retried as a whole) per call, not per slice
+        def write_slices(tx):
+            for start in range(0, len(cleaned_batch), BULK_BATCH_SIZE):
+                tx.run(query, batch=cleaned_batch[start:start + BULK_BATCH_SIZE])
+
+        with self.session() as session:
+            session.execute_write(write_slices)
 
     def create_structured_relationship(self, source_label, source_prop, target_label, target_prop, rel_type):
         """Create relationships between structured nodes based on matching property values"""
+        # The type comes from the LLM mapping and is interpolated into Cypher, so only a normalized label is allowed
+        rel_type = self._normalize_rel_type(rel_type)
         query = f"""
         MATCH (s:`{source_label}`)
         MATCH (t:`{target_label}`)
@@ -282,101 +610,138 @@ class Neo4jService:
         MERGE (s)-[:{rel_type}]->(t)
         """
         print(f"    Executing Link Query: {query.strip()}")
-        with self.driver.session() as session:
-            session.run(query)
+        self._write(query)
 
     def _ensure_vector_index(self, label: str):
         """Create a vector index for a specific Node Label"""
+        if label in self._vector_indexed:
+            return
+        self._vector_indexed.add(label)
+        self._vector_index_names = None
         index_name = f"{label.lower()}_embeddings"
-        with self.driver.session() as session:
+        try:
+            self._write(f"""
+                CREATE VECTOR INDEX `{index_name}` IF NOT EXISTS
+                FOR (n:`{label}`)
+                ON n.embedding
+                OPTIONS {{indexConfig: {{
+                    `vector.dimensions`: 1536,
+                    `vector.similarity_function`: 'cosine',
+                    `vector.quantization.enabled`: true,
+                    `vector.hnsw.m`: {HNSW_M},
+                    `vector.hnsw.ef_construction`: {HNSW_EF_CONSTRUCTION}
+                }}}}
+            """)
+        except Exception as e:
+            print(f"⚠️ Index creation warning for {label}: {e}")
+
+    def _searchable_labels(self, labels: List[str]) -> List[str]:
+        """The labels that have an online vector index; the router may pick labels like Entity that don't"""
+        cached = self._vector_index_names
+        if cached is None or time.monotonic() >= cached[0]:
             try:
-                session.run(f"""
-                    CREATE VECTOR INDEX `{index_name}` IF NOT EXISTS
-                    FOR (n:`{label}`)
-                    ON n.embedding
-                    OPTIONS {{indexConfig: {{
-                        `vector.dimensions`: 1536,
-                        `vector.similarity_function`: 'cosine'
-                    }}}}
-                """)
+                records = self._read("SHOW VECTOR INDEXES YIELD name, state WHERE state = 'ONLINE' RETURN name")
             except Exception as e:
-                print(f"⚠️ Index creation warning for {label}: {e}")
+                print(f"⚠️ Could not list vector indexes: {e}")
+                return labels
+            cached = (time.monotonic() + RETRIEVAL_CACHE_TTL, {r[0] for r in records})
+            self._vector_index_names = cached
+        return [label for label in labels if f"{label.lower()}_embeddings" in cached[1]]
 
     def structured_vector_search(self, query_embedding: List[float], label: str, top_k: int = 5):
         """Vector search for Structured Nodes"""
         index_name = f"{label.lower()}_embeddings"
-        with self.driver.session() as session:
-            try:
-                result = session.run(f"""
-                    CALL db.index.vector.queryNodes('{index_name}', $top_k, $query_embedding)
-                    YIELD node, score
-                    RETURN node, score
-                """, query_embedding=query_embedding, top_k=top_k)
-                return [dict(record) for record in result]
-            except Exception as e:
-                print(f"⚠️ Structured vector search skipped (Index {index_name} missing): {e}")
-                return []
+        try:
+            return self._read_data(f"""
+                CALL db.index.vector.queryNodes('{index_name}', $candidates, $query_embedding)
+                YIELD node, score
+                WITH node, score
+                LIMIT $top_k
+                RETURN node {{.*, embedding: null}} AS node, score
+            """, query_embedding=query_embedding, top_k=top_k, candidates=max(top_k, VECTOR_EF_SEARCH))
+        except Exception as e:
+            print(f"⚠️ Structured vector search skipped (Index {index_name} missing): {e}")
+            return []
 
-    def structured_graphrag_search(self, query: str, target_labels: List[str], top_k: int = 5) -> Dict:
-        """Complete RAG retrieval for SQL data"""
-        query_embedding = embed_text([query])[0]
+    def structured_graphrag_search(self, query: str, target_labels: List[str], top_k: int = 5, query_embedding: List[float] = None) -> Dict:
+        """Complete RAG retrieval for SQL data; pass query_embedding if it was computed ahead of time"""
+        if query_embedding is None:
+            query_embedding = embed_query(query)
         
-        found_nodes = []
-        for label in target_labels:
-            vector_hits = self.structured_vector_search(query_embedding, label, top_k)
-            for hit in vector_hits:
-                node_data = dict(hit['node'])
-                if 'embedding' in node_data:
-                    del node_data['embedding']
-                found_nodes.append({
-                    "label": label, 
-                    "data": node_data, 
-                    "score": hit['score']
-                })
-        
-        if not found_nodes:
+        target_labels = self._searchable_labels(target_labels)
+        if not target_labels:
             return {"nodes": [], "relationships": []}
 
-        node_ids = []
+        try:
+            # Vector hits for every label and their relationships in one round trip
+            record = self._read(
+                _structured_search_query(len(target_labels)),
+                indexes=[f"{label.lower()}_embeddings" for label in target_labels],
+                labels=target_labels,
+                query_embedding=query_embedding,
+                top_k=top_k,
+                candidates=max(top_k, VECTOR_EF_SEARCH)
+            )[0]
+            found_nodes = record['hits']
+            rel_rows = record['relationships']
+        except ClientError as e:
+            # An index dropped since the labels were filtered fails the whole statement; any other error is a bug
+            if e.code != "Neo.ClientError.Procedure.ProcedureCallFailed":
+                raise
+            print(f"⚠️ Combined structured search failed ({e.message}), searching labels one by one")
+            found_nodes, rel_rows = self._structured_search_per_label(query_embedding, target_labels, top_k)
+
         for n in found_nodes:
-            if 'id' in n['data']:
-                node_ids.append(n['data']['id'])
+            n['data'].pop('embedding', None)
         
+        if not found_nodes:
+            return {"nodes": [], "relationships": []}
+
         relationships = []
-        if node_ids:
-            with self.driver.session() as session:
-                rel_query = """
-                MATCH (start_node)
-                WHERE start_node.id IN $ids
-                MATCH (start_node)-[r]-(connected_node)
-                RETURN 
-                    labels(start_node)[0] as start_type,
-                    properties(start_node) as start_props,
-                    type(r) as rel_type,
-                    labels(connected_node)[0] as end_type,
-                    properties(connected_node) as end_props
-                LIMIT 50
-                """
-                
-                rel_results = session.run(rel_query, ids=node_ids)
-                
-                for r in rel_results:
-                    start_props = r['start_props']
-                    end_props = r['end_props']
-                    
-                    start_label = start_props.get('name') or start_props.get('title') or start_props.get('series_title') or start_props.get('full_nm') or "Entity"
-                    end_label = end_props.get('name') or end_props.get('title') or end_props.get('series_title') or end_props.get('full_nm') or "Entity"
-                    
-                    relationships.append(f"{start_label} ({r['start_type']}) --[{r['rel_type']}]--> {end_label} ({r['end_type']})")
+        for r in rel_rows:
+            start_props = r['start_props']
+            end_props = r['end_props']
+            
+            start_label = start_props.get('name') or start_props.get('title') or start_props.get('series_title') or start_props.get('full_nm') or "Entity"
+            end_label = end_props.get('name') or end_props.get('title') or end_props.get('series_title') or end_props.get('full_nm') or "Entity"
+            
+            relationships.append(f"{start_label} ({r['start_type']}) --[{r['rel_type']}]--> {end_label} ({r['end_type']})")
 
         return {
             "nodes": found_nodes,
             "relationships": relationships
         }
 
+    def _structured_search_per_label(self, query_embedding: List[float], target_labels: List[str], top_k: int):
+        """Fallback: one vector lookup per label, then one neighbour query over all hits"""
+        # Each label has its own vector index; the lookups are independent, so run them concurrently
+        found_nodes = []
+        with ThreadPoolExecutor(max_workers=max(1, min(8, len(target_labels)))) as executor:
+            label_hits = list(executor.map(
+                lambda label: self.structured_vector_search(query_embedding, label, top_k),
+                target_labels
+            ))
+
+        for label, vector_hits in zip(target_labels, label_hits):
+            for hit in vector_hits:
+                found_nodes.append({
+                    "label": label, 
+                    "data": dict(hit['node']), 
+                    "score": hit['score']
+                })
+
+        node_ids = [n['data']['id'] for n in found_nodes if n['data'].get('id') is not None]
+        rel_rows = self._read_data(STRUCTURED_NEIGHBOURS_QUERY, ids=node_ids) if node_ids else []
+        return found_nodes, rel_rows
+
     def get_all_labels(self) -> List[str]:
         """Fetch all unique Node Labels currently in the graph"""
-        with self.driver.session() as session:
-            result = session.run("CALL db.labels()")
-            labels = [r[0] for r in result]
-            return labels
+        records = self._read("CALL db.labels()")
+        return [r[0] for r in records]
+
+@functools.lru_cache(maxsize=1)
+def get_service() -> Neo4jService:
+    """Process-wide Neo4jService, so every route shares one driver and connection pool"""
+    service = Neo4jService()
+    atexit.register(service.close)
+    return service
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from services.neo4j_service import Neo4jService
+from services.neo4j_service import get_service
 from core.sql_load import load_structured_data
 
 load_dotenv()
@@ -13,7 +13,7 @@ db_params = {
     'port': os.getenv('POSTGRES_PORT', '5432')
 }
 
-neo4j = Neo4jService()
+neo4j = get_service()
 load_structured_data(db_params, neo4j)
 neo4j.close()
 
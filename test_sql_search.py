@@ -1,16 +1,17 @@
-from core.pdf_processor import embed_text
-from services.neo4j_service import Neo4jService
+from core.pdf_processor import embed_query
+from services.neo4j_service import get_service
 from core.agents import sql_graphrag_agent
 
-neo4j = Neo4jService()
+neo4j = get_service()
 query = "What movies did Al Pacino act in and what are they about?"
 
-query_embedding = embed_text([query])[0]
+query_embedding = embed_query(query)
 
 context = neo4j.structured_graphrag_search(
-    query_embedding, 
+    query,
     target_labels=["Movie", "Actor"], 
-    top_k=5
+    top_k=5,
+    query_embedding=query_embedding
 )
 
 print(context)